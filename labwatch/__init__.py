@@ -1,9 +1,17 @@
 #!/usr/bin/env python
 # coding=utf-8
 from __future__ import division, print_function, unicode_literals
-from labwatch.assistant import LabAssistant
 
 __version__ = "0.1dev"
 __authors__ = ["Jost Tobias Springenberg", "Aaron Klein", "Klaus Greff"]
 __url__ = "https://github.com/automl/labwatch"
 __all__ = ['LabAssistant', '__version__', '__authors__', '__url__']
+
+
+def __getattr__(name):
+    # the assistant pulls in sacred and pymongo, only import it when needed
+    if name == 'LabAssistant':
+        from labwatch.assistant import LabAssistant
+        return LabAssistant
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__,
+                                                                   name))
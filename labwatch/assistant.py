@@ -2,28 +2,62 @@
 # coding=utf-8
 from __future__ import division, print_function, unicode_literals
 
+import ast
+import contextlib
+import copy
 import datetime
 import time
 import numbers
 import functools
-import gridfs
+import os
+import signal
+import socket
+import threading
+import uuid
 import pymongo
+import pymongo.errors
+from bson import ObjectId
 
 import sacred.optional as opt
 
-from sacred.commandline_options import QueueOption
+from sacred.commandline_options import CommandLineOption
 from sacred.observers.mongo import MongoObserver, MongoDbOption
-from sacred.utils import create_basic_stream_logger
+from sacred.serializer import flatten
+from sacred.utils import create_basic_stream_logger, join_paths
 
-from labwatch.optimizers.random_search import RandomSearch
-from labwatch.searchspace import SearchSpace, build_search_space, fill_in_values, \
-    get_values_from_config
+from labwatch.optimizers import get_optimizer
+from labwatch.searchspace import SearchSpace, build_search_space
 
+from labwatch.utils.mongo import (get_client, get_gridfs, reconnect,
+                                  reconnect_gridfs)
+from labwatch.utils.checkpoint import dump_state, load_state
+from labwatch.utils.rng import get_rng
 from labwatch.utils.version_checks import (check_dependencies, check_sources,
                                            check_names)
 
-# SON Manipulators for saving and retrieving search spaces
-SON_MANIPULATORS = []
+# states of runs that have not finished yet and might still complete
+ACTIVE_STATES = ['QUEUED', 'INITIALIZING', 'RUNNING']
+# update_optimizer excludes at most this many known runs on the server,
+# more are filtered after they were fetched
+MAX_EXCLUDED_RUNS = 1000
+
+# the experiment of LabAssistant.optimize(), worker processes inherit it
+# when they are forked since experiments can not be pickled
+_experiment = None
+# the process whose clients the observers of _experiment use
+_experiment_pid = None
+
+
+def _run_experiment(command, config, meta_info):
+    global _experiment_pid
+    if _experiment_pid != os.getpid():
+        # the MongoClients of the parent must not be used after fork()
+        _experiment.observers = [_reconnect_observer(o)
+                                 for o in _experiment.observers]
+        _experiment_pid = os.getpid()
+    run = _experiment.run(command, config_updates=config,
+                          meta_info=meta_info)
+    return run._id, run.result
 
 
 class FakeRun(object):
@@ -31,27 +65,198 @@ class FakeRun(object):
         self.observers = []
 
 
-class SearchSpaceManipulator(pymongo.son_manipulator.SONManipulator):
+def _reconnect_observer(observer):
+    """
+    Returns a copy of a MongoObserver that writes through the clients of
+    this process, other observers are returned as they are.
+    """
+    if not isinstance(observer, MongoObserver):
+        return observer
+    runs = reconnect(observer.runs)
+    if runs is observer.runs:
+        return observer
+    observer = copy.copy(observer)
+    observer.runs = runs
+    if observer.metrics is not None:
+        observer.metrics = reconnect(observer.metrics)
+    if observer.fs is not None:
+        observer.fs = reconnect_gridfs(observer.fs)
+    return observer
 
-    def transform_incoming(self, son, collection):
-        return son
 
-    def transform_outgoing(self, son, collection):
-        if "_class" in son.keys():
-            if son["_class"] == "SearchSpace":
-                return SearchSpace.from_json(son)
-        else:
-            for (key, value) in son.items():
-                if isinstance(value, dict):
-                    if "_class" in value:
-                        if value["_class"] == "SearchSpace":
-                            son[key] = SearchSpace(value)
-                    else:  # Again, make sure to recurse into sub-docs
-                        son[key] = self.transform_outgoing(value, collection)
-        return son
+def parse_optimizer_spec(spec):
+    """
+    Parse the name and keyword arguments of an optimizer from a string of
+    the form "NAME [key=value ...]". Values are parsed as python literals
+    if possible and otherwise kept as strings.
+
+    Returns
+    -------
+    (str, dict)
+        The name of the optimizer and its keyword arguments.
+    """
+    tokens = spec.split()
+    if not tokens:
+        raise ValueError("No optimizer given")
+    kwargs = dict()
+    for token in tokens[1:]:
+        key, sep, value = token.partition('=')
+        if not sep or not key:
+            raise ValueError("Invalid optimizer argument {!r}, expected "
+                             "key=value".format(token))
+        try:
+            kwargs[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            kwargs[key] = value
+    return tokens[0], kwargs
+
+
+class OptimizerOption(CommandLineOption):
+    """Select the optimizer of the LabAssistant by name."""
+
+    arg = 'SPEC'
+    arg_description = "Name of the optimizer followed by its keyword " \
+                      "arguments, e.g. 'BayesianOptimization burnin=50'"
+
+    @classmethod
+    def apply(cls, args, run):
+        # applied by the option hook of the LabAssistant
+        pass
+
+
+class ObjectiveMongoObserver(MongoObserver):
+    """
+    MongoObserver that additionally stores the objective of a completed run
+    in its own field, such that the best runs can be found with an index.
+    """
+
+    def completed_event(self, stop_time, result):
+        try:
+            self.run_entry['objective'] = convert_result(result)
+        except (ValueError, AssertionError):
+            self.run_entry['objective'] = None
+        super(ObjectiveMongoObserver, self).completed_event(stop_time,
+                                                            result)
+
+
+class OptimizerState(object):
+    """
+    The optimizer of one search space together with the information which
+    runs from the database it has already seen.
+    """
+
+    def __init__(self, optimizer):
+        self.optimizer = optimizer
+        # all runs with an _id up to the watermark have been seen, the ones
+        # above it are tracked individually in known_jobs
+        self.known_jobs = set()
+        self.watermark = None
+        # guards the optimizer, which might be used by a prefetch thread
+        self.lock = threading.RLock()
+        # number of observations and time of the last checkpoint
+        self.saved_observations = None
+        self.saved_time = None
+
+    def get_state(self):
+        return {'optimizer': self.optimizer.get_state(),
+                'optimizer_class': type(self.optimizer).__name__,
+                'n_observations': len(self.optimizer.observations),
+                'watermark': self.watermark,
+                'known_jobs': sorted(self.known_jobs)}
+
+    def set_state(self, state):
+        self.optimizer.set_state(state['optimizer'])
+        self.watermark = state['watermark']
+        self.known_jobs = set(state['known_jobs'])
 
 
-SON_MANIPULATORS.append(SearchSpaceManipulator())
+class SuggestionPrefetcher(threading.Thread):
+    """
+    Background thread that keeps a few suggestions for the current search
+    space ready, such that starting a run does not have to wait for the
+    optimizer to fit its model.
+
+    The thread polls the database for new results. Whenever the optimizer
+    received new observations all suggestions made before are dropped.
+    """
+
+    def __init__(self, assistant, size, poll_interval):
+        super(SuggestionPrefetcher, self).__init__(name='labwatch-prefetch')
+        self.daemon = True
+        self.assistant = assistant
+        self.size = size
+        self.poll_interval = poll_interval
+        # entries are (search space hash, number of observations, suggestion)
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+
+    def pop(self, space_hash, n_observations):
+        """
+        Returns a ready suggestion for the search space that was made with
+        the given number of observations or None. Outdated suggestions of
+        the search space are dropped.
+        """
+        suggestion = None
+        with self.lock:
+            self.buffer = [entry for entry in self.buffer
+                           if entry[0] != space_hash or
+                           entry[1] == n_observations]
+            for i, entry in enumerate(self.buffer):
+                if entry[0] == space_hash:
+                    suggestion = self.buffer.pop(i)[2]
+                    break
+        self.wakeup.set()
+        return suggestion
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wakeup.clear()
+            try:
+                idle = self._prefetch()
+            except Exception:
+                self.assistant.logger.exception("Prefetching failed")
+                idle = True
+            if idle:
+                self.wakeup.wait(self.poll_interval)
+
+    def _prefetch(self):
+        assistant = self.assistant
+        with assistant._lock:
+            space = assistant.current_search_space
+            state = assistant.optimizer_state
+            if space is None or state is None or assistant.db is None:
+                return True
+            assistant.update_optimizer()
+
+        optimizer = state.optimizer
+        with state.lock:
+            n_observations = len(optimizer.observations)
+            with self.lock:
+                # suggestions made with fewer observations are outdated
+                self.buffer = [entry for entry in self.buffer
+                               if entry[0] != space.hash or
+                               entry[1] == n_observations]
+                ready = [entry[2] for entry in self.buffer
+                         if entry[0] == space.hash]
+            if len(ready) >= self.size:
+                return True
+            # ready suggestions must not be suggested again
+            pending = optimizer.pending
+            optimizer.set_pending(pending + ready)
+            try:
+                suggestion = optimizer.suggest_configuration()
+            finally:
+                optimizer.pending = pending
+
+        with self.lock:
+            self.buffer.append((space.hash, n_observations, suggestion))
+        return False
 
 
 class LabAssistant(object):
@@ -68,9 +273,21 @@ class LabAssistant(object):
                  experiment,
                  database_name=None,
                  url="localhost",
+                 client_options=None,
                  optimizer=None,
                  prefix='runs',
-                 always_inject_observer=False):
+                 always_inject_observer=False,
+                 heartbeat_timeout=120,
+                 lease_time=600,
+                 max_retries=3,
+                 seed=None,
+                 snapshot_dir=None,
+                 checkpoint=False,
+                 prefetch=0,
+                 prefetch_interval=5,
+                 optimizer_kwargs=None,
+                 checkpoint_every=10,
+                 checkpoint_interval=60):
 
         """
         Create a new LabAssistant and connects it with a database.
@@ -82,13 +299,60 @@ class LabAssistant(object):
         database_name : str
             The name of the database where all information about the runs 
             are saved.
-        optimizer: object, optional
+        url: str, optional
+            Host name or MongoDB URI of the database.
+        client_options: dict, optional
+            Keyword arguments for the pymongo.MongoClient, e.g. maxPoolSize,
+            serverSelectionTimeoutMS or w. Assistants with the same url and
+            options share one client.
+        optimizer: str or type, optional
             Specifies which optimizer is used to suggest a new hyperparameter
-            configuration
+            configuration, either an Optimizer subclass or its name, see
+            labwatch.optimizers.get_optimizer. Defaults to RandomSearch and
+            can be overridden with the --optimizer command line option.
         prefix: str, optional
             Additional prefix for the database
         always_inject_observer: bool, optional
             If true an MongoObserver is added to the experiment.
+        heartbeat_timeout: float, optional
+            Seconds after which a running run without a heartbeat is
+            considered dead and is no longer reported to the optimizer as
+            pending.
+        lease_time: float, optional
+            Seconds a worker may take from claiming a queued run until the
+            run is started. Afterwards the claim expires.
+        max_retries: int, optional
+            How often reap_stalled_runs() puts a run whose worker died back
+            into the queue before it is marked as FAILED.
+        seed: int or numpy.random.Generator, optional
+            Seed for the random number generator of the optimizer. Parallel
+            workers should each get their own child generator, see
+            labwatch.utils.rng.spawn_rngs.
+        snapshot_dir: str, optional
+            If given, the optimizer of each search space is saved to this
+            directory whenever it received new results, such that a
+            restarted LabAssistant can resume from it.
+        checkpoint: bool, optional
+            Like snapshot_dir but stores the state of the optimizers in
+            GridFS, keyed by the search space and the number of
+            observations, such that workers on other machines can resume
+            from it without replaying all runs.
+        prefetch: int, optional
+            If larger than zero, a background thread keeps this many
+            suggestions ready such that get_suggestion() returns without
+            waiting for the optimizer.
+        prefetch_interval: float, optional
+            Seconds between two checks of the prefetch thread for new
+            results. Suggestions are at most this much out of date.
+        optimizer_kwargs: dict, optional
+            Keyword arguments for the optimizer besides the search space
+            and rng.
+        checkpoint_every: int, optional
+            A snapshot or checkpoint is written once the optimizer received
+            this many new observations ...
+        checkpoint_interval: float, optional
+            ... or once this many seconds passed since the last one and
+            there are new observations.
         """
 
         self.ex = experiment
@@ -96,6 +360,7 @@ class LabAssistant(object):
 
         self.db_name = database_name
         self.url = url
+        self.client_options = client_options or {}
         self.db = None
 
         self.ex.logger = create_basic_stream_logger()
@@ -103,25 +368,98 @@ class LabAssistant(object):
         self.prefix = prefix
         self.version_policy = 'newer'
         self.always_inject_observer = always_inject_observer
+        self.heartbeat_timeout = heartbeat_timeout
+        self.lease_time = lease_time
+        self.max_retries = max_retries
+        self.rng = get_rng(seed)
         self.optimizer_class = optimizer
-        self.block_time = 1000  # TODO: what value should this be?
+        self.optimizer_kwargs = optimizer_kwargs or {}
+        # wait for queued runs with change streams if the server supports
+        # them, otherwise poll with a backoff of at most this many seconds
+        self.use_change_streams = True
+        # experiment info of this worker and the experiments of runs that
+        # were already verified against it
+        self._ex_info = None
+        self._verified_experiments = set()
+        # set to shut down serve() after the current runs
+        self._stopping = threading.Event()
+        self.max_poll_interval = 60
         # remember for which experiments we have config hooks setup
         self.observer_mapping = dict()
-        # mark that we have newer looked for finished runs
-        self.known_jobs = set()
-        self.last_checked = None
+        self.snapshot_dir = snapshot_dir
+        self.checkpoint = checkpoint
+        self.checkpoint_fs = None
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self.prefetch = prefetch
+        self.prefetch_interval = prefetch_interval
+        self.prefetcher = None
+        # serializes the access to the database state of the optimizers
+        self._lock = threading.RLock()
+        # one warm optimizer for each search space by its hash
+        self.optimizers = dict()
+        self.optimizer_state = None
+        self.optimizer = None
         self.current_search_space = None
+        self.current_search_space_name = None
+        # functions decorated with search_space(), by name
+        self.search_space_definitions = dict()
+        # search spaces that were already verified, by their hash
+        self.search_spaces = dict()
         self.mongo_observer = None
+        self._add_commands()
+
+    def _add_commands(self):
+        assistant = self
+
+        def reap_stalled_runs():
+            """Requeue or fail runs whose worker died."""
+            if assistant.db is None:
+                assistant._init_db()
+            assistant.reap_stalled_runs()
+
+        self.ex.command(reap_stalled_runs, unobserved=True)
 
     def _option_hook(self, options):
+        optimizer_opt = options.get(OptimizerOption.get_flag())
+        if optimizer_opt:
+            name, kwargs = parse_optimizer_spec(optimizer_opt)
+            if (name, kwargs) != (self.optimizer_class,
+                                  self.optimizer_kwargs):
+                self.optimizer_class, self.optimizer_kwargs = name, kwargs
+                # the optimizers created so far are of the wrong kind
+                self.optimizers = dict()
         mongo_opt = options.get(MongoDbOption.get_flag())
         if mongo_opt is not None:
-            fake_run = FakeRun()
-            MongoDbOption.apply(mongo_opt, fake_run)
-            self.mongo_observer = fake_run.observers[0]
+            # like MongoDbOption.apply but with the shared client
+            kwargs = MongoDbOption.parse_mongo_db_arg(mongo_opt)
+            client = get_client(kwargs.pop('url', 'localhost'))
+            self.mongo_observer = MongoObserver.create(client=client,
+                                                       **kwargs)
         else:
             self.mongo_observer = None
 
+    def _reconnect(self):
+        """
+        Replaces all database handles that were inherited from the parent
+        process, must be called in a forked child before it uses them.
+        """
+        observers = dict()
+        for observer in self.ex.observers + [self.mongo_observer]:
+            if observer is not None:
+                observers[id(observer)] = _reconnect_observer(observer)
+        self.ex.observers = [observers[id(o)] for o in self.ex.observers]
+        if self.mongo_observer is not None:
+            self.mongo_observer = observers[id(self.mongo_observer)]
+        if self.db is not None:
+            self.runs = reconnect(self.runs)
+            self.db = self.runs.database
+            self.db_search_space = self.db.search_space
+        self.checkpoint_fs = None
+        # threads and locks of the parent do not exist in the child
+        self._lock = threading.RLock()
+        self.prefetcher = None
+
     def _init_db(self):
         if self.db_name is None:
             if self.mongo_observer is None:
@@ -132,62 +470,204 @@ class LabAssistant(object):
                     raise RuntimeError('No mongo observer found!')
                 self.mongo_observer = mongo_observers[-1]
         else:
-            self.mongo_observer = MongoObserver.create(db_name=self.db_name,
-                                                       collection=self.prefix,
-                                                       url=self.url)
+            database = get_client(self.url,
+                                  **self.client_options)[self.db_name]
+            self.mongo_observer = ObjectiveMongoObserver(
+                database[self.prefix], get_gridfs(database),
+                metrics_collection=database['metrics'])
             self._inject_observer()
         self.runs = self.mongo_observer.runs
         self.db = self.runs.database
         self.db_search_space = self.db.search_space
 
-        for manipulator in SON_MANIPULATORS:
-            self.db.add_son_manipulator(manipulator)
+        # search spaces are looked up by their content hash
+        self.db_search_space.create_index('hash', unique=True, sparse=True)
+
+        # supports the incremental queries of update_optimizer
+        self.runs.create_index([('meta.options.UPDATE', pymongo.ASCENDING),
+                                ('status', pymongo.ASCENDING),
+                                ('_id', pymongo.ASCENDING)])
+
+        # supports get_top_k
+        self.runs.create_index([('meta.options.UPDATE', pymongo.ASCENDING),
+                                ('status', pymongo.ASCENDING),
+                                ('objective', pymongo.ASCENDING)])
+
+        # supports claiming the next run from the queue
+        self.runs.create_index([('status', pymongo.ASCENDING),
+                                ('experiment.name', pymongo.ASCENDING),
+                                ('priority', pymongo.DESCENDING),
+                                ('_id', pymongo.ASCENDING)])
 
     def _verify_and_init_search_space(self, space_from_ex):
         # Get a search space from the database or from the experiment
+        space_hash = space_from_ex.hash
+        if space_hash in self.search_spaces:
+            self.current_search_space = self.search_spaces[space_hash]
+            return self.current_search_space
 
         # Check if search space is already in the database
-        # (Note: We don't have any id yet that's why we have to loop over all entries)
-        in_db = False
-        if self.db_search_space.count() > 0:
-            for sp in self.db_search_space.find():
-                if sp == space_from_ex:
-                    self.current_search_space = sp
-                    in_db = True
-        if not in_db:
-            sp_id = self.db_search_space.insert(space_from_ex.to_json())
-            self.current_search_space = self.db_search_space.find_one({"_id": sp_id})
+        son = self.db_search_space.find_one({'hash': space_hash})
+        if son is None:
+            son = self._find_search_space_without_hash(space_hash)
+        if son is None:
+            try:
+                self.db_search_space.insert_one(space_from_ex.to_json())
+            except pymongo.errors.DuplicateKeyError:
+                pass  # someone else inserted it in the meantime
+            son = self.db_search_space.find_one({'hash': space_hash})
 
+        self.current_search_space = SearchSpace.from_json(son)
+        self.search_spaces[space_hash] = self.current_search_space
         return self.current_search_space
 
+    def _find_search_space_without_hash(self, space_hash):
+        # search spaces stored by older versions have no hash yet
+        for son in self.db_search_space.find({'hash': {'$exists': False}}):
+            sp = SearchSpace.from_json(dict(son))
+            if sp.hash == space_hash:
+                self.db_search_space.update_one({'_id': son['_id']},
+                                                {'$set': {'hash': space_hash}})
+                son['hash'] = space_hash
+                return son
+        return None
+
+    def _init_optimizer(self):
+        space = self.current_search_space
+        state = self.optimizers.get(space.hash)
+        if state is None:
+            # Create the optimizer, only its backend is imported
+            optimizer_class = get_optimizer(self.optimizer_class or
+                                            'RandomSearch')
+            optimizer = optimizer_class(space, rng=self.rng,
+                                        **self.optimizer_kwargs)
+            state = OptimizerState(optimizer)
+            checkpoint = self._load_checkpoint()
+            if checkpoint is not None:
+                name = checkpoint.get('optimizer_class',
+                                      optimizer_class.__name__)
+                if name == optimizer_class.__name__:
+                    state.set_state(checkpoint)
+                else:
+                    self.logger.warning(
+                        'Ignoring checkpoint of a {} optimizer'.format(name))
+        self.optimizers[space.hash] = state
+        self.optimizer_state = state
+        self.optimizer = state.optimizer
+        return self.optimizer
+
+    def _snapshot_path(self, space_hash):
+        return os.path.join(self.snapshot_dir, '{}.npz'.format(space_hash))
+
+    def _get_checkpoint_fs(self):
+        if self.checkpoint_fs is None:
+            self.checkpoint_fs = get_gridfs(
+                self.db, collection='{}_checkpoints'.format(self.prefix))
+        return self.checkpoint_fs
+
+    def _load_checkpoint(self):
+        """
+        Returns the checkpoint of the current search space with the most
+        observations from the snapshot directory or the database, or None.
+        """
+        data = []
+        if self.snapshot_dir is not None:
+            path = self._snapshot_path(self.current_search_space.hash)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    data.append(f.read())
+        if self.checkpoint and self.db is not None:
+            fs = self._get_checkpoint_fs()
+            cursor = fs.find(
+                {'metadata.search_space': self.current_search_space._id},
+                sort=[('metadata.n_observations', pymongo.DESCENDING)],
+                limit=1)
+            for grid_out in cursor:
+                data.append(grid_out.read())
+        checkpoints = []
+        for d in data:
+            try:
+                checkpoints.append(load_state(d))
+            except ValueError as e:
+                self.logger.warning('Ignoring broken checkpoint: {}'.format(e))
+        if not checkpoints:
+            return None
+        checkpoint = max(checkpoints, key=lambda c: c['n_observations'])
+        self.logger.info('Resuming optimizer with {} observations'.format(
+            checkpoint['n_observations']))
+        return checkpoint
+
+    def _save_checkpoint(self, force=False):
+        """
+        Writes the state of the current optimizer if it received
+        checkpoint_every new observations or checkpoint_interval seconds
+        passed since the last checkpoint, or if forced to.
+        """
+        if self.snapshot_dir is None and not self.checkpoint:
+            return
+        optimizer_state = self.optimizer_state
+        with optimizer_state.lock:
+            n = len(optimizer_state.optimizer.observations)
+            saved = optimizer_state.saved_observations
+            if saved is not None:
+                if n == saved:
+                    return
+                elapsed = time.time() - optimizer_state.saved_time
+                if not force and n - saved < self.checkpoint_every and \
+                        elapsed < self.checkpoint_interval:
+                    return
+            state = optimizer_state.get_state()
+            optimizer_state.saved_observations = n
+            optimizer_state.saved_time = time.time()
+        data = dump_state(state)
+        if self.snapshot_dir is not None:
+            if not os.path.exists(self.snapshot_dir):
+                os.makedirs(self.snapshot_dir)
+            path = self._snapshot_path(self.current_search_space.hash)
+            # write to a temporary file first such that a crash can never
+            # leave a broken snapshot behind
+            tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.rename(tmp_path, path)
+        if self.checkpoint and self.db is not None:
+            fs = self._get_checkpoint_fs()
+            space_id = self.current_search_space._id
+            n = state['n_observations']
+            fs.put(data, filename='{}.npz'.format(space_id),
+                   metadata={'search_space': space_id, 'n_observations': n})
+            # only the newest checkpoint of each search space is kept
+            for old in fs.find({'metadata.search_space': space_id,
+                                'metadata.n_observations': {'$lt': n}}):
+                fs.delete(old._id)
+
     def _clean_config(self, config):
-        values = get_values_from_config(config, self.current_search_space.parameters)
-        return values
+        return self.current_search_space.get_values(config)
+
+    def _select_search_space(self, space, space_name):
+        """Makes the search space and its optimizer the current ones."""
+        sp = build_search_space(space)
+
+        with self._lock:
+            # the prefetch thread reads the name together with the optimizer
+            # state, both have to change at once
+            self.current_search_space_name = space_name
+            # Establish connection to database
+            if self.db is None:
+                self._init_db()
+
+            # Check the validity of this search space
+            self._verify_and_init_search_space(sp)
+
+            # Get the optimizer of this search space
+            self._init_optimizer()
 
     def _search_space_wrapper(self, space, space_name, fixed=None,
                               fallback=None, preset=None):
         # This function pretends to be a ConfigScope for a named_config
         # but under the hood it is getting a suggestion from the optimizer
 
-        self.current_search_space_name = space_name
-        sp = build_search_space(space)
-
-        # Establish connection to database
-        if self.db is None:
-            self._init_db()
-
-        # Check the validity of this search space
-        self._verify_and_init_search_space(sp)
-
-        # Create the optimizer
-        if self.optimizer_class is not None:
-            if not self.db:
-                import warnings
-                warnings.warn('No database. Falling back to random search')
-                self.optimizer = RandomSearch(self.current_search_space)
-            self.optimizer = self.optimizer_class(self.current_search_space)
-        else:
-            self.optimizer = RandomSearch(self.current_search_space)
+        self._select_search_space(space, space_name)
 
         fixed = fixed or {}
         final_config = dict(preset or {})
@@ -203,8 +683,7 @@ class LabAssistant(object):
         values = self.get_suggestion()
 
         # Create configuration object
-        config = fill_in_values(self.current_search_space.search_space, values,
-                                fill_by='uid')
+        config = self.current_search_space.fill(values)
         final_config.update(config)
         final_config.update(fixed)
 
@@ -218,119 +697,515 @@ class LabAssistant(object):
             self.ex.observers.append(self.mongo_observer)
 
 
+    def _watch_queue(self, max_await_time):
+        """
+        Opens a change stream that reports runs becoming QUEUED or None if
+        the server does not support change streams (i.e. standalone
+        servers and pymongo < 3.6).
+        """
+        if not self.use_change_streams:
+            return None
+        pipeline = [{'$match': {'$or': [
+            {'operationType': {'$in': ['insert', 'replace']},
+             'fullDocument.status': 'QUEUED'},
+            {'operationType': 'update',
+             'updateDescription.updatedFields.status': 'QUEUED'}]}}]
+        try:
+            return self.runs.watch(
+                pipeline, max_await_time_ms=int(max_await_time * 1000))
+        except (TypeError, NotImplementedError,
+                pymongo.errors.PyMongoError) as e:
+            self.logger.info("Change streams are not available ({}), "
+                             "falling back to polling".format(e))
+            self.use_change_streams = False
+            return None
+
+    def _get_experiment_info(self):
+        # hashing all sources is expensive and they do not change while
+        # the worker is alive
+        if self._ex_info is None:
+            self._ex_info = self.ex.get_experiment_info()
+        return self._ex_info
+
+    def _resolve_sources(self, sources):
+        # the MongoObserver stores sources as (name, GridFS file id), they
+        # are compared by the md5 hash of the file
+        with self._lock:
+            fs = self.mongo_observer.fs
+        resolved = []
+        for name, ref in sources:
+            if isinstance(ref, ObjectId):
+                ref = fs.get(ref).md5
+            resolved.append((name, ref))
+        return resolved
+
+    def _verify_run(self, run):
+        """
+        Checks that the run was queued for this experiment, with the same
+        sources and compatible dependencies. Experiments that passed the
+        checks once are remembered.
+        """
+        ex_info = self._get_experiment_info()
+        experiment = run['experiment']
+        key = (experiment['name'],
+               tuple(tuple(source) for source in experiment['sources']),
+               tuple(experiment['dependencies']))
+        if key in self._verified_experiments:
+            return
+        check_names(ex_info['name'], experiment['name'])
+        check_sources(ex_info['sources'],
+                      self._resolve_sources(experiment['sources']))
+        check_dependencies(ex_info['dependencies'],
+                           experiment['dependencies'], self.version_policy)
+        self._verified_experiments.add(key)
+
+    def _claim_run(self):
+        """
+        Atomically takes the queued run of this experiment with the highest
+        priority (the oldest one among equals) by setting its status to
+        INITIALIZING. Returns None if the queue is empty.
+
+        Runs of other experiments are left to their workers, runs of this
+        experiment with other sources or dependencies are rejected by
+        _verify_run().
+        """
+        now = datetime.datetime.utcnow()
+        claim = {'worker': '{}:{}'.format(socket.gethostname(), os.getpid()),
+                 'token': uuid.uuid4().hex,
+                 'time': now,
+                 'lease_expires': now + datetime.timedelta(
+                     seconds=self.lease_time)}
+        return self.runs.find_one_and_update(
+            {'status': 'QUEUED', 'experiment.name': self.ex.path},
+            {'$set': {'status': 'INITIALIZING', 'claim': claim}},
+            projection=['experiment', 'command', 'config', 'meta',
+                        'priority', 'claim'],
+            sort=[('priority', pymongo.DESCENDING),
+                  ('_id', pymongo.ASCENDING)],
+            return_document=pymongo.ReturnDocument.AFTER)
+
+    def _renew_claim(self, run):
+        """
+        Extends the lease of a claimed run if the claim is still ours.
+        Returns False if the claim expired and the run was requeued or
+        taken by another worker in the meantime.
+        """
+        lease_expires = datetime.datetime.utcnow() + datetime.timedelta(
+            seconds=self.lease_time)
+        result = self.runs.update_one(
+            {'_id': run['_id'], 'status': 'INITIALIZING',
+             'claim.token': run['claim']['token']},
+            {'$set': {'claim.lease_expires': lease_expires}})
+        return result.matched_count == 1
+
+    def _release_run(self, run):
+        """Puts a claimed run back into the queue."""
+        self.runs.update_one(
+            {'_id': run['_id'], 'claim.token': run['claim']['token']},
+            {'$set': {'status': 'QUEUED'}, '$unset': {'claim': ''}})
+
+    def _await_queued(self, stream, deadline):
+        """
+        Blocks until the change stream reports a queued run, the deadline
+        passed or the assistant is stopped. Returns the stream or None if it
+        failed, the caller then falls back to polling.
+        """
+        try:
+            # try_next() returns None after max_await_time without a change
+            while stream.try_next() is None:
+                if time.time() >= deadline or self._stopping.is_set():
+                    break
+            return stream
+        except pymongo.errors.PyMongoError as e:
+            self.logger.warning("The change stream failed ({}), falling "
+                                "back to polling".format(e))
+            try:
+                stream.close()
+            except pymongo.errors.PyMongoError:
+                pass
+            return None
+
     def _dequeue_run(self, remaining_time, sleep_time):
-        criterion = {'status': 'QUEUED'}
-        ex_info = self.ex.get_experiment_info()
-        run = None
-        start_time = time.time()
-        while remaining_time > 0.:
-            run = self.runs.find_one(criterion)
-            if run is None:
-                self.logger.warn('Could not find run from queue waiting for '
-                                 'max another {} s'.format(remaining_time))
-                time.sleep(sleep_time)
-                expired_time = (time.time() - start_time)
-                remaining_time = self.block_time - expired_time
-            else:
-                # verify the run
-                check_names(ex_info['name'], run['experiment']['name'])
-                check_sources(ex_info['sources'], run['experiment']['sources'])
-                check_dependencies(ex_info['dependencies'],
-                                   run['experiment']['dependencies'],
-                                   self.version_policy)
-                
-                # set status to INITIALIZING to prevent others from
-                # running the same Run.
-                old_status = run['status']
-                run['status'] = 'INITIALIZING'
-                replace_summary = self.runs.replace_one(
-                    {'_id': run['_id'], 'status': old_status},
-                    replacement=run)
-                if replace_summary.modified_count == 1 or \
-                   replace_summary.raw_result['updatedExisting']:
-                    # the second part above is necessary in case we are
-                    # working with an older mongodb server (version < 2.6)
-                    # which will not return the modified_count flag
-                    break  # we've successfully acquired a run
-        return run
+        deadline = time.time() + remaining_time
+        # the stream has to be open before we look at the queue, otherwise
+        # runs queued in between would only be noticed after the timeout
+        stream = self._watch_queue(sleep_time)
+        delay = sleep_time
+        waiting = False
+        try:
+            while not self._stopping.is_set():
+                run = self._claim_run()
+                remaining_time = deadline - time.time()
+                if run is None:
+                    if remaining_time <= 0.:
+                        return None
+                    if not waiting:
+                        self.logger.warn('Could not find run from queue '
+                                         'waiting for max another {} s'
+                                         .format(remaining_time))
+                        waiting = True
+                    if stream is not None:
+                        # only claim again once a run was queued
+                        stream = self._await_queued(stream, deadline)
+                    else:
+                        # poll with exponential backoff
+                        self._stopping.wait(min(delay, remaining_time))
+                        delay = min(2 * delay, self.max_poll_interval)
+                    continue
+
+                # verify the run, if it does not fit this worker give it
+                # back to the queue such that another worker can take it
+                try:
+                    self._verify_run(run)
+                except Exception:
+                    self._release_run(run)
+                    raise
+                return run
+            return None
+        finally:
+            if stream is not None:
+                stream.close()
         
     # ########################## exported functions ###########################
 
     def set_database(self, database):
         self.db = database
         self._init_db()
+        self.search_spaces = dict()
+        self.optimizers = dict()
+        self.checkpoint_fs = None
         # we need to verify the search space again
         self._verify_and_init_search_space(self.current_search_space)
     
     def update_optimizer(self):
+        """
+        Gives the runs of the current search space that completed since the
+        last update to its optimizer.
+
+        Only runs above a watermark are queried. The watermark cannot pass
+        the oldest run that is still active, so sacred runs that were killed
+        and stay RUNNING hold it back until reap_stalled_runs() fails or
+        requeues them. It should run regularly, e.g. with the
+        reap_stalled_runs command.
+        """
         if self.db is None:
             self.logger.warn("Cannot update optimizer, reason: no database!")
             return
-        # First check database for all configurations
-        if self.last_checked is None:
-            # if we never checked the database we have to check
-            # everything that happened since the definition of time ;)
-            self.last_checked = datetime.datetime.min
-        # oldest_still_running = None
-        # running_jobs = self.runs.find(
-        #     {
-        #         'heartbeat': {'$gte': self.last_checked},
-        #         'status': 'RUNNING'
-        #     },
-        #     sort=[("start_time", 1)]
-        # )
-        #
+        # if we never checked the database we have to check everything that
+        # happened since the definition of time ;) otherwise only the runs
+        # above the watermark can contain anything new
+        state = self.optimizer_state
+        space_query = {'meta.options.UPDATE': self.current_search_space_name}
+        if state.watermark is not None:
+            space_query['_id'] = {'$gt': state.watermark}
+
+        # Find the oldest run that might still complete. This has to happen
+        # before we look for completed runs, otherwise a run finishing in
+        # between both queries could end up below the watermark unseen.
+        query = dict(space_query, status={'$in': ACTIVE_STATES})
+        oldest_active = self.runs.find_one(query, projection=['_id'],
+                                           sort=[('_id', pymongo.ASCENDING)])
+
+        # Take all jobs that are finished, were run with a config from this
+        # search space and were not seen before. The runs above the
+        # watermark that are already known are excluded on the server, such
+        # that an old active run does not cause a scan of all later runs.
+        query = dict(space_query, status='COMPLETED')
+        exclude = 0 < len(state.known_jobs) <= MAX_EXCLUDED_RUNS
+        if exclude:
+            query['_id'] = dict(space_query.get('_id', {}),
+                                **{'$nin': sorted(state.known_jobs)})
+        elif state.known_jobs and oldest_active is not None:
+            self.logger.warning(
+                "{} runs above the watermark are known, it is held back by "
+                "run {}. Run reap_stalled_runs if its worker died."
+                .format(len(state.known_jobs), oldest_active['_id']))
+        completed_jobs = [job for job in self.runs.find(
+            query, projection=['config', 'result', 'objective'],
+            sort=[('_id', pymongo.ASCENDING)])
+            if exclude or job['_id'] not in state.known_jobs]
+
+        self._backfill_objectives(jobs=completed_jobs)
 
-        # Take all jobs that are finished and were run with a config from this search space
-        completed_jobs = self.runs.find(
-            {
-                'heartbeat': {'$gte': self.last_checked},
-                'status': 'COMPLETED',
-                'meta.options.UPDATE': self.current_search_space_name
-            }
-        )
-        # update the last checked to the oldest one that is still running
-        self.last_checked = datetime.datetime.now()
         # collect all configs and their results
-        info = [(self._clean_config(job["config"]), convert_result(job["result"]), job)
-                for job in completed_jobs if job["_id"] not in self.known_jobs]        
+        info = [(self._clean_config(job["config"]),
+                 convert_result(job["result"]), job)
+                for job in completed_jobs]
+
+        # the watermark can safely advance up to the oldest active run.
+        # Sacred's MongoObserver and _insert_runs give a new run the id
+        # max(_id) + 1, so no run can show up below an existing one later.
+        seen = state.known_jobs | {job['_id'] for job in completed_jobs}
+        done = [run_id for run_id in seen
+                if oldest_active is None or run_id < oldest_active['_id']]
+        if done:
+            state.watermark = max(done)
+        state.known_jobs = {run_id for run_id in seen
+                            if state.watermark is None or
+                            run_id > state.watermark}
+
+        # tell the optimizer which configs are currently evaluated, runs
+        # without a recent heartbeat are considered dead
+        pending = self._get_pending_configs(space_query)
+        with state.lock:
+            state.optimizer.set_pending(pending)
+            if len(info) > 0:
+                configs, results, jobs = (list(x) for x in zip(*info))
+                modifications = state.optimizer.update(configs, results, jobs)
         if len(info) > 0:
-            configs, results, jobs = (list(x) for x in zip(*info))
-            self.known_jobs |= {job['_id'] for job in jobs}
-            modifications = self.optimizer.update(configs, results, jobs)
             # the optimizer might modify the additional info of jobs
-            if modifications is not None:
-                for job in modifications:
-                    new_info = job.info
-                    self.runs.update_one(
-                        {'_id': job["_id"]},
-                        {'$set': {'info': new_info}},
-                        upsert=False)
+            if modifications:
+                self._write_info(modifications)
+            self._save_checkpoint()
+
+    def _write_info(self, modifications):
+        # only the changed fields of the info are written, all with a
+        # single round trip
+        requests = [pymongo.UpdateOne(
+                        {'_id': run_id},
+                        {'$set': {'info.{}'.format(key): value
+                                  for key, value in changes.items()}})
+                    for run_id, changes in modifications.items() if changes]
+        if requests:
+            self.runs.bulk_write(requests, ordered=False)
+
+    def _suggestion_to_values(self, suggestion):
+        # map the parameter names used by the optimizer back to uids
+        return {self.current_search_space.parameters[k]['uid']: v
+                for k, v in suggestion.items()
+                if k in self.current_search_space.parameters}
+
+    def _insert_runs(self, entries):
+        # Insert all run entries with a single round trip. Like the
+        # MongoObserver we use increasing integer ids and simply retry with
+        # the next free ones if another process was faster.
+        ids = []
+        while entries:
+            last = self.runs.find_one({}, projection=['_id'],
+                                      sort=[('_id', pymongo.DESCENDING)])
+            next_id = last['_id'] + 1 if last is not None else 1
+            for i, entry in enumerate(entries):
+                entry['_id'] = next_id + i
+            try:
+                self.runs.insert_many(entries, ordered=True)
+                inserted = len(entries)
+            except pymongo.errors.BulkWriteError as e:
+                errors = e.details['writeErrors']
+                if any(err['code'] != 11000 for err in errors):
+                    raise
+                inserted = e.details['nInserted']
+            ids.extend(entry['_id'] for entry in entries[:inserted])
+            entries = entries[inserted:]
+        return ids
+
+    def _stalled_queries(self):
+        """
+        Returns queries for runs whose claim expired and for running runs
+        without a recent heartbeat.
+        """
+        now = datetime.datetime.utcnow()
+        alive_since = now - datetime.timedelta(seconds=self.heartbeat_timeout)
+        return [
+            {'status': 'INITIALIZING', 'claim.lease_expires': {'$lt': now}},
+            {'status': 'RUNNING', 'heartbeat': {'$lt': alive_since}},
+            {'status': 'RUNNING', 'heartbeat': None,
+             'start_time': {'$lt': alive_since}}
+        ]
+
+    def _get_pending_configs(self, space_query):
+        now = datetime.datetime.utcnow()
+        alive_since = now - datetime.timedelta(seconds=self.heartbeat_timeout)
+        query = dict(space_query)
+        query['$or'] = [
+            {'status': 'QUEUED'},
+            {'status': 'INITIALIZING', 'claim.lease_expires': {'$gte': now}},
+            {'status': 'RUNNING', 'heartbeat': {'$gte': alive_since}},
+            {'status': 'RUNNING', 'heartbeat': None,
+             'start_time': {'$gte': alive_since}}
+        ]
+        pending_jobs = self.runs.find(query, projection=['config'])
+        return [self._clean_config(job['config']) for job in pending_jobs]
+
+    def reap_stalled_runs(self, max_retries=None):
+        """
+        Puts runs whose worker died back into the queue.
+
+        A run is considered dead if its claim expired before it was started
+        or if it is running but did not send a heartbeat for
+        heartbeat_timeout seconds. Runs that were already retried
+        max_retries times are marked as FAILED instead.
+
+        Parameters
+        ----------
+        max_retries: int, optional
+            Overrides the max_retries of the LabAssistant.
+
+        Returns
+        -------
+        tuple(list, list)
+            The ids of the requeued runs and of the failed runs.
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+        requeued, failed = [], []
+        for query in self._stalled_queries():
+            for run in list(self.runs.find(query, projection=['retries'])):
+                retries = run.get('retries', 0)
+                # the query is repeated such that a run that came back to
+                # life or was reaped by someone else in between is skipped
+                criterion = dict(query, _id=run['_id'])
+                if retries < max_retries:
+                    result = self.runs.update_one(criterion, {
+                        '$set': {'status': 'QUEUED', 'retries': retries + 1},
+                        '$unset': {'claim': '', 'heartbeat': '',
+                                   'start_time': ''}})
+                    ids = requeued
+                else:
+                    result = self.runs.update_one(criterion, {'$set': {
+                        'status': 'FAILED',
+                        'stop_time': datetime.datetime.utcnow(),
+                        'fail_trace': ['Worker died and the run was retried '
+                                       '{} times'.format(retries)]}})
+                    ids = failed
+                if result.modified_count == 1:
+                    ids.append(run['_id'])
+        if requeued or failed:
+            self.logger.info('Requeued runs {} and failed runs {}'.format(
+                requeued, failed))
+        return requeued, failed
 
     def get_suggestion(self):
         if self.current_search_space is None:
             raise ValueError("LabAssistant sample_suggestion called "
                              "without a defined search space")
+        if self.prefetch > 0:
+            if self.prefetcher is None:
+                self.prefetcher = SuggestionPrefetcher(
+                    self, self.prefetch, self.prefetch_interval)
+                self.prefetcher.start()
+            with self._lock:
+                state = self.optimizer_state
+            with state.lock:
+                n_observations = len(state.optimizer.observations)
+            suggestion = self.prefetcher.pop(self.current_search_space.hash,
+                                             n_observations)
+            if suggestion is not None:
+                return self._suggestion_to_values(suggestion)
+
         #if self.optimizer.needs_updates():
-        self.update_optimizer()
+        with self._lock:
+            self.update_optimizer()
+            state = self.optimizer_state
+        with state.lock:
+            suggestion = state.optimizer.suggest_configuration()
+        return self._suggestion_to_values(suggestion)
+
+    def get_suggestions(self, n):
+        """
+        Get n suggestions from the optimizer that can be run in parallel.
 
-        suggestion = self.optimizer.suggest_configuration()
-        values = {self.current_search_space.parameters[k]['uid']: v for k, v in suggestion.items() if k in self.current_search_space.parameters}
-        return values
+        The optimizer is updated (and fitted) only once for the whole batch.
+
+        Parameters
+        ----------
+        n: int
+            The number of suggestions.
+
+        Returns
+        -------
+        list[dict]
+            List of dictionaries mapping uids to values.
+        """
+        if self.current_search_space is None:
+            raise ValueError("LabAssistant get_suggestions called "
+                             "without a defined search space")
+        with self._lock:
+            self.update_optimizer()
+            state = self.optimizer_state
+        with state.lock:
+            suggestions = state.optimizer.suggest_configurations(n)
+        return [self._suggestion_to_values(s) for s in suggestions]
+
+    def stop_prefetch(self):
+        """Stops the background thread that prefetches suggestions."""
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+            self.prefetcher.join()
+            self.prefetcher = None
+
+    def _objective_query(self):
+        query = {'status': 'COMPLETED'}
+        if self.current_search_space is not None:
+            query['meta.options.UPDATE'] = self.current_search_space_name
+        return query
+
+    def _backfill_objectives(self, query=None, jobs=None):
+        # runs that were not stored by an ObjectiveMongoObserver get their
+        # objective here, afterwards the objective index can be used
+        if jobs is None:
+            jobs = self.runs.find(dict(query, objective={'$exists': False}),
+                                  projection=['result'])
+        requests = []
+        for job in jobs:
+            if 'objective' in job:
+                continue
+            try:
+                objective = convert_result(job.get('result'))
+            except (ValueError, AssertionError):
+                objective = None
+            requests.append(pymongo.UpdateOne(
+                {'_id': job['_id']}, {'$set': {'objective': objective}}))
+        if requests:
+            self.runs.bulk_write(requests, ordered=False)
+
+    def get_top_k(self, k, return_job_info=False):
+        """
+        Returns the k completed runs of the current search space with the
+        lowest objective, best first.
+
+        Parameters
+        ----------
+        k: int
+            The number of runs.
+        return_job_info: bool, optional
+            If true the run documents are returned as well.
+
+        Returns
+        -------
+        list[tuple]
+            Tuples of the configuration, the objective and if requested
+            the run.
+        """
+        if self.db is None:
+            self.logger.warn("cannot query runs, reason: no database!")
+            return []
+        query = self._objective_query()
+        self._backfill_objectives(query=query)
+        query['objective'] = {'$ne': None}
+        top = []
+        for job in self.runs.find(query, sort=[('objective', 1)], limit=k):
+            if self.current_search_space is not None:
+                config = self._clean_config(job['config'])
+            else:
+                config = job['config']
+            if return_job_info:
+                top.append((config, job['objective'], job))
+            else:
+                top.append((config, job['objective']))
+        return top
 
     def get_current_best(self, return_job_info=False):
         if self.db is None:
             self.logger.warn("cannot update optimizer, reason: no database!")
             return
-        # ("status", 1) sorts according to status in ascending order
-        best_job = self.runs.find_one({'status': 'COMPLETED'},
-                                      sort=[("result", 1)])
-        if best_job is None:
+        top = self.get_top_k(1, return_job_info=True)
+        if not top:
             best_result = None
             best_config = None
+            best_job = None
         else:
+            best_config, _, best_job = top[0]
             best_result = best_job["result"]
-            best_config = self._clean_config(best_job["config"])
         if return_job_info:
             return best_config, best_result, best_job
         else:
@@ -340,7 +1215,7 @@ class LabAssistant(object):
         # get config from optimizer
         #return self.run_config(self.get_suggestion(), command)
         values = self.get_suggestion()
-        config = fill_in_values(self.current_search_space.search_space, values, fill_by='uid')
+        config = self.current_search_space.fill(values)
 
         return self.run_config(config, command)
 
@@ -361,15 +1236,63 @@ class LabAssistant(object):
             res = self.ex.run_command(command, config_updates=config)
         return res
 
-    def enqueue_suggestion(self, command='main'):
-        # Next get config from optimizer
-        config = self._clean_config(self.get_suggestion())
-        if config is None:
-            raise RuntimeError("Optimizer did not return a config!")
-        self._inject_observer()
-        res = self.ex.run_command(command,
-                                  config_updates=config,
-                                  args={"--queue": QueueOption()})
+    def enqueue_suggestion(self, command=None, priority=0):
+        return self.enqueue_suggestions(1, command, priority)[0]
+
+    def enqueue_suggestions(self, n, command=None, priority=0):
+        """
+        Queue n suggested configurations for the experiment.
+
+        All suggestions are generated from a single optimizer fit and the
+        queued runs are written to the database with one insert_many.
+
+        Parameters
+        ----------
+        n: int
+            The number of runs to enqueue.
+        command: str, optional
+            The command that should be run, defaults to the main function.
+        priority: int, optional
+            Workers take runs with a higher priority first and runs of the
+            same priority in the order they were queued.
+
+        Returns
+        -------
+        list
+            The ids of the queued runs.
+        """
+        if self.mongo_observer is None:
+            raise ValueError("LabAssistant has no database "
+                             "but you called enqueue_suggestions")
+        # creating runs calls the option hook which resets the observer
+        observer = self.mongo_observer
+        space = self.current_search_space
+        options = {'UPDATE': [self.current_search_space_name]}
+
+        entries = []
+        sources = None
+        for values in self.get_suggestions(n):
+            config = space.fill(values)
+            run = self.ex._create_run(command, config_updates=config,
+                                      options=options)
+            if sources is None:
+                # the sources are identical for all runs of the batch
+                sources = observer.save_sources(run.experiment_info)
+            meta_info = dict(run.meta_info)
+            meta_info['queue_time'] = datetime.datetime.utcnow()
+            entry = {
+                'experiment': dict(run.experiment_info, sources=sources),
+                'command': join_paths(run.main_function.prefix,
+                                      run.main_function.signature.name),
+                'host': dict(run.host_info),
+                'config': flatten(run.config),
+                'meta': meta_info,
+                'status': 'QUEUED',
+                'priority': priority
+            }
+            entries.append(entry)
+        self.mongo_observer = observer
+        return self._insert_runs(entries)
 
     def run_from_queue(self, wait_time_in_s=10 * 60, sleep_time=5):
         run = self._dequeue_run(wait_time_in_s, sleep_time)
@@ -377,37 +1300,276 @@ class LabAssistant(object):
             self.logger.warn("No run found in queue for {} s -> terminating"
                              .format(wait_time_in_s))
             return None
-        else:
-            # remove MongoObserver if we have one for that experiment
-            had_matching_observer = False
-            if self.ex in self.observer_mapping:
-                had_matching_observer = True
-                matching = None
-                for i, observer in enumerate(self.ex.observers):
-                    if observer == self.observer_mapping[self.ex]:
-                        matching = i
-                if matching is None:
-                    self.logger.warn("Could not remove observer in run_from_queue")
+        return self._run_queued(run)
+
+    def _run_queued(self, queued):
+        """
+        Executes a claimed run, returns None without starting it if the
+        claim was lost.
+        """
+        if not self._renew_claim(queued):
+            self.logger.warning("Lost the claim of run {}, it is not "
+                                "started".format(queued['_id']))
+            return None
+        with self._lock:
+            # creating the run calls the option hook which resets the
+            # observer
+            observer = self.mongo_observer
+            # keep the meta info of the queued run, it names the search
+            # space the run belongs to
+            run = self.ex._create_run(queued['command'],
+                                      config_updates=queued['config'],
+                                      meta_info=queued.get('meta'))
+            self.mongo_observer = observer
+        # the run gets its own MongoObserver that overwrites the queued run,
+        # it replaces all observers writing to the same collection
+        fs = get_gridfs(self.db, collection=self.prefix)
+        run.observers = [o for o in run.observers
+                         if not (isinstance(o, MongoObserver) and
+                                 o.runs == self.runs)]
+        run.observers.append(ObjectiveMongoObserver(self.runs, fs,
+                                                    overwrite=queued))
+        run()
+        return run
+
+    def serve(self, max_runs=None, concurrency=1, idle_timeout=10 * 60,
+              sleep_time=5):
+        """
+        Executes queued runs back to back until the queue stays empty.
+
+        On SIGTERM no new runs are started and the method returns once the
+        runs in progress are finished.
+
+        Parameters
+        ----------
+        max_runs: int, optional
+            Stop after this many runs, by default there is no limit.
+        concurrency: int, optional
+            Number of runs executed in parallel. Sacred keeps the current
+            run, the random seeds and the observers per process, so every
+            run executes in its own forked worker process with its own
+            database clients if this is larger than one.
+        idle_timeout: float, optional
+            Seconds to wait for new runs before shutting down.
+        sleep_time: float, optional
+            Initial polling interval if the database does not support
+            change streams.
+
+        Returns
+        -------
+        list
+            The ids of the finished runs.
+        """
+        self._stopping.clear()
+        if concurrency == 1:
+            claimed = [0]
+
+            def claim():
+                if max_runs is not None and claimed[0] >= max_runs:
+                    return False
+                claimed[0] += 1
+                return True
+
+            finished = []
+            with self._handle_sigterm():
+                self._serve_loop(claim, finished.append, idle_timeout,
+                                 sleep_time)
+            return finished
+
+        import multiprocessing
+        try:
+            import queue
+        except ImportError:
+            import Queue as queue
+        # the prefetch thread would not survive the fork
+        self.stop_prefetch()
+        ctx = multiprocessing.get_context('fork')
+        claimed = ctx.Value('i', 0)
+        finished = ctx.Queue()
+        workers = [ctx.Process(target=self._serve_worker,
+                               args=(claimed, max_runs, finished,
+                                     idle_timeout, sleep_time))
+                   for _ in range(concurrency)]
+        for worker in workers:
+            worker.start()
+
+        def forward(signum, frame):
+            self.logger.info("Received SIGTERM, finishing the current runs")
+            for worker in workers:
+                if worker.is_alive():
+                    os.kill(worker.pid, signal.SIGTERM)
+
+        run_ids = []
+        with self._handle_sigterm(forward):
+            while any(worker.is_alive() for worker in workers):
+                try:
+                    run_ids.append(finished.get(timeout=1))
+                except queue.Empty:
                     pass
-                else:
-                    del self.ex.observers[matching]
-                    del self.observer_mapping[self.ex]
-            # add a matching MongoObserver to the experiment and tell it to
-            # overwrite the run
-            fs = gridfs.GridFS(self.db, collection=self.prefix)
-            self.ex.observers.append(MongoObserver(self.runs, fs,
-                                                   overwrite=run))
-
-            # run the experiment
-            res = self.ex.run_command(run['command'],
-                                      config_updates=run['config'])
-
-            # remove the extra observer
-            self.ex.observers.pop()
-            # and inject the default one
-            if had_matching_observer:
-                self._inject_observer()
-            return res
+        for worker in workers:
+            worker.join()
+        while True:
+            try:
+                run_ids.append(finished.get(timeout=0.1))
+            except queue.Empty:
+                break
+        return run_ids
+
+    def _serve_worker(self, claimed, max_runs, finished, idle_timeout,
+                      sleep_time):
+        # runs in a forked process that must not use the parent's clients
+        self._reconnect()
+
+        def claim():
+            with claimed.get_lock():
+                if max_runs is not None and claimed.value >= max_runs:
+                    return False
+                claimed.value += 1
+                return True
+
+        with self._handle_sigterm():
+            self._serve_loop(claim, finished.put, idle_timeout, sleep_time)
+        finished.close()
+        finished.join_thread()
+
+    def _serve_loop(self, claim, report, idle_timeout, sleep_time):
+        while not self._stopping.is_set() and claim():
+            try:
+                queued = self._dequeue_run(idle_timeout, sleep_time)
+            except Exception:
+                # the queue holds runs this worker can not execute
+                self.logger.exception("Could not take run from queue")
+                return
+            if queued is None:
+                return
+            try:
+                run = self._run_queued(queued)
+            except Exception:
+                # sacred already stored the failure of the run
+                self.logger.exception("Run {} failed".format(queued['_id']))
+                continue
+            if run is not None:
+                report(run._id)
+
+    @contextlib.contextmanager
+    def _handle_sigterm(self, handler=None):
+        """Stops serving on SIGTERM while the context is active."""
+        def stop(signum, frame):
+            self.logger.info("Received SIGTERM, finishing the current runs")
+            self._stopping.set()
+
+        previous_handler = None
+        if threading.current_thread() is threading.main_thread():
+            previous_handler = signal.signal(signal.SIGTERM, handler or stop)
+        try:
+            yield
+        finally:
+            if previous_handler is not None:
+                signal.signal(signal.SIGTERM, previous_handler)
+
+    def optimize(self, n_iterations, n_workers=1, command=None,
+                 search_space=None):
+        """
+        Runs suggestions of the optimizer on this machine in n_workers
+        parallel processes.
+
+        A new suggestion is made as soon as a run finished and its result
+        was given to the optimizer. Runs that are still in progress are
+        treated as pending. The runs are stored by the MongoObservers of
+        the experiment and the observer of the assistant, just like when
+        they are executed from the queue.
+
+        Parameters
+        ----------
+        n_iterations: int
+            The total number of runs.
+        n_workers: int, optional
+            The number of runs executed in parallel.
+        command: str, optional
+            The command that should be run, defaults to the main function.
+        search_space: str, optional
+            The name of a search space defined with the search_space
+            decorator. By default the search space of the last run that
+            used one of them as named config is optimized.
+
+        Returns
+        -------
+        list[tuple(dict, object)]
+            The configurations (parameter names to values) and results of
+            all successful runs in the order they finished.
+        """
+        from concurrent.futures import (ProcessPoolExecutor, wait,
+                                        FIRST_COMPLETED)
+        import multiprocessing
+
+        if search_space is not None:
+            if search_space not in self.search_space_definitions:
+                raise KeyError("Unknown search space {!r}".format(
+                    search_space))
+            self._select_search_space(
+                self.search_space_definitions[search_space], search_space)
+        if self.current_search_space is None:
+            raise ValueError("LabAssistant optimize called "
+                             "without a defined search space")
+        if self.db is None:
+            self._init_db()
+        # the runs have to be stored such that update_optimizer finds them
+        self._inject_observer()
+        global _experiment, _experiment_pid
+        _experiment = self.ex
+        _experiment_pid = os.getpid()
+        space = self.current_search_space
+        meta_info = {'options': {'UPDATE': [self.current_search_space_name]}}
+
+        with self._lock:
+            self.update_optimizer()
+            state = self.optimizer_state
+        # runs of other workers found in the database
+        pending = list(state.optimizer.pending)
+
+        in_flight = dict()
+        results = []
+        n_submitted = 0
+        executor = ProcessPoolExecutor(
+            n_workers, mp_context=multiprocessing.get_context('fork'))
+        try:
+            while n_submitted < n_iterations or in_flight:
+                while (n_submitted < n_iterations and
+                       len(in_flight) < n_workers):
+                    with state.lock:
+                        state.optimizer.set_pending(
+                            pending + list(in_flight.values()))
+                        suggestion = state.optimizer.suggest_configuration()
+                    config = space.fill(
+                        self._suggestion_to_values(suggestion))
+                    future = executor.submit(_run_experiment, command, config,
+                                             meta_info)
+                    in_flight[future] = suggestion
+                    n_submitted += 1
+
+                done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in done:
+                    suggestion = in_flight.pop(future)
+                    try:
+                        run_id, result = future.result()
+                        cost = convert_result(result)
+                    except Exception:
+                        # sacred already stored the failure of the run
+                        self.logger.exception("Run failed")
+                        continue
+                    with state.lock:
+                        if run_id is not None:
+                            # update_optimizer must not report the run again
+                            state.known_jobs.add(run_id)
+                        state.optimizer.update([suggestion], [cost],
+                                               [{'_id': run_id}])
+                    results.append((suggestion, result))
+        finally:
+            executor.shutdown()
+            with state.lock:
+                state.optimizer.set_pending(pending)
+        self._save_checkpoint(force=True)
+        return results
 
     # ############################## Decorators ###############################
 
@@ -427,6 +1589,7 @@ class LabAssistant(object):
         # self._verify_and_init_search_space(space)
 
         # Get a configuration from the optimizer and add it as a named config
+        self.search_space_definitions[function.__name__] = function
         search_space_wrapper = functools.partial(self._search_space_wrapper,
                                                  space=function,
                                                  space_name=function.__name__)
@@ -5,7 +5,7 @@ from __future__ import division, print_function, unicode_literals
 from labwatch.searchspace import SearchSpace
 from labwatch.utils.types import basic_types, str_to_types
 from labwatch.utils.types import ParamValueExcept
-import numpy as np
+from labwatch.utils.rng import get_seed
 
 # TODO: guard ConfigSpace import
 from ConfigSpace import ConfigurationSpace, Configuration
@@ -88,7 +88,7 @@ def convert_simple_param(name, param):
                          "notation.".format(param))
 
 
-def sacred_space_to_configspace(space):
+def sacred_space_to_configspace(space, rng=None):
     """
     Convert a Labwatch searchspace to a ConfigSpace.
 
@@ -97,6 +97,9 @@ def sacred_space_to_configspace(space):
     space: labwatch.searchspace.SearchSpace
         A labwatch searchspace to be converted.
 
+    rng: numpy.random.Generator, optional
+        Generator from which the seed of the ConfigurationSpace is drawn.
+
     Returns
     -------
     ConfigSpace.ConfigurationSpace:
@@ -132,7 +135,7 @@ def sacred_space_to_configspace(space):
         non_conditions[name] = converted_result
         conditions.append(cond)
     # finally build the ConfigSpace
-    cs = ConfigurationSpace(seed=np.random.seed())
+    cs = ConfigurationSpace(seed=get_seed(rng))
     for _name, param in non_conditions.items():
         cs.add_hyperparameter(param)
     for cond in conditions:
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# coding=utf-8
+from __future__ import division, print_function, unicode_literals
+
+import numpy as np
+
+from labwatch.hyperparameters import (Constant, Categorical, UniformNumber,
+                                      Gaussian, ConditionResult)
+from labwatch.utils.types import ParamValueExcept, str_to_types
+
+
+def _choice_value(choice):
+    if isinstance(choice, Constant):
+        return choice["value"]
+    return choice
+
+
+def _numeric_bounds(param):
+    # integers own the interval [i - 0.5, i + 0.5) such that every integer
+    # covers an equally large part of the unit interval
+    lower, upper = float(param["lower"]), float(param["upper"])
+    if str_to_types[param["type"]] == int:
+        lower, upper = lower - 0.5, upper + 0.5
+    if param["log_scale"]:
+        lower, upper = np.log(lower), np.log(upper)
+    return lower, upper
+
+
+class VectorEncoder(object):
+    """
+    Maps configurations of a SearchSpace to vectors and back.
+
+    Every parameter is one dimension, the dimensions are ordered by the
+    names of the parameters. Uniform numbers are mapped to [0, 1] (after
+    taking the log if they are on a log scale), categorical parameters to
+    the index of their value, Gaussians are standardized and constants are
+    always 0. Inactive conditional parameters are NaN.
+    """
+
+    def __init__(self, search_space):
+        self.search_space = search_space
+        self.names = sorted(search_space.parameters)
+        self.n_dims = len(self.names)
+        self.params = []
+        # conditional parameters as (name, parent name, condition)
+        self.conditions = []
+        for name in self.names:
+            param = search_space.parameters[name]
+            if isinstance(param, ConditionResult):
+                parent = search_space.uids_to_names[param["condition"]["uid"]]
+                self.conditions.append((name, parent, param["condition"]))
+                param = param["result"]
+            if not isinstance(param, (Constant, Categorical, UniformNumber,
+                                      Gaussian)):
+                raise ParamValueExcept("Can not encode parameter {} of type "
+                                       "{}".format(name, type(param)))
+            self.params.append(param)
+        self._choice_indices = [
+            {_choice_value(c): i for i, c in enumerate(param["choices"])}
+            if isinstance(param, Categorical) else None
+            for param in self.params]
+
+    def encode(self, configs):
+        """
+        Encode a batch of configurations.
+
+        Parameters
+        ----------
+        configs: list[dict]
+            Configurations mapping parameter names to values, inactive
+            parameters are missing or None.
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (len(configs), n_dims).
+        """
+        X = np.full([len(configs), self.n_dims], np.nan)
+        for j, name in enumerate(self.names):
+            column = [config.get(name) for config in configs]
+            active = np.array([v is not None for v in column], dtype=bool)
+            if active.any():
+                values = [v for v in column if v is not None]
+                X[active, j] = self._encode_values(j, values)
+        return X
+
+    def _encode_values(self, j, values):
+        param = self.params[j]
+        if isinstance(param, Constant):
+            return np.zeros(len(values))
+        elif isinstance(param, Categorical):
+            indices = self._choice_indices[j]
+            return np.array([indices[v] for v in values], dtype=float)
+        values = np.asarray(values, dtype=float)
+        if param["log_scale"]:
+            values = np.log(values)
+        if isinstance(param, Gaussian):
+            return (values - param["mu"]) / param["sigma"]
+        lower, upper = _numeric_bounds(param)
+        return (values - lower) / (upper - lower)
+
+    def decode(self, X):
+        """
+        Decode a batch of vectors into configurations.
+
+        Values are rounded and clipped to the nearest valid value, the
+        values of conditional parameters whose condition is not satisfied
+        are removed.
+
+        Parameters
+        ----------
+        X: np.ndarray
+            Array of shape (n, n_dims).
+
+        Returns
+        -------
+        list[dict]
+            Configurations mapping parameter names to values.
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        columns = []
+        for j in range(self.n_dims):
+            active = ~np.isnan(X[:, j])
+            column = [None] * X.shape[0]
+            if active.any():
+                values = self._decode_values(j, X[active, j])
+                for i, value in zip(np.flatnonzero(active), values):
+                    column[i] = value
+            columns.append(column)
+        configs = [{name: value for name, value in zip(self.names, row)
+                    if value is not None}
+                   for row in zip(*columns)]
+        for config in configs:
+            self._apply_conditions(config)
+        return configs
+
+    def _decode_values(self, j, x):
+        param = self.params[j]
+        if isinstance(param, Constant):
+            return [param["value"]] * len(x)
+        elif isinstance(param, Categorical):
+            choices = param["choices"]
+            indices = np.clip(np.rint(x), 0, len(choices) - 1).astype(int)
+            return [_choice_value(choices[i]) for i in indices]
+        if isinstance(param, Gaussian):
+            values = x * param["sigma"] + param["mu"]
+        else:
+            lower, upper = _numeric_bounds(param)
+            values = lower + np.clip(x, 0., 1.) * (upper - lower)
+        if param["log_scale"]:
+            values = np.exp(values)
+        if isinstance(param, Gaussian):
+            return values.tolist()
+        values = np.clip(values, param["lower"], param["upper"])
+        if str_to_types[param["type"]] == int:
+            return np.rint(values).astype(int).tolist()
+        return values.tolist()
+
+    def _apply_conditions(self, config):
+        # conditions can depend on other conditional parameters, so repeat
+        # until nothing changes
+        changed = True
+        while changed:
+            changed = False
+            for name, parent, condition in self.conditions:
+                if name in config and not (parent in config and
+                                           condition.sample(config[parent])):
+                    del config[name]
+                    changed = True
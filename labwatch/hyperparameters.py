@@ -9,6 +9,7 @@ from labwatch.utils.types import (str_to_class, basic_types, types_to_str,
                                   str_to_types, ParamInconsistent)
 from labwatch.utils.types import ParamValueExcept
 from labwatch.utils import FixedDict
+from labwatch.utils.rng import get_rng
 
 # global parameter counting
 parameter_counter = 0
@@ -62,9 +63,12 @@ class Parameter(FixedDict):
     def valid(self, value):
         raise NotImplementedError("valid() not implemented")
 
-    def sample(self):
+    def sample(self, rng=None):
         raise NotImplementedError("sample() not implemented")
 
+    def sample_batch(self, n, rng=None):
+        raise NotImplementedError("sample_batch() not implemented")
+
     @classmethod
     def decode(cls, storage):
         raise NotImplementedError(
@@ -89,9 +93,12 @@ class Constant(Parameter):
     def default(self):
         return self["value"]
 
-    def sample(self):
+    def sample(self, rng=None):
         return self.default()
 
+    def sample_batch(self, n, rng=None):
+        return np.full(n, self["value"])
+
     def valid(self, value):
         return self["value"] == value
 
@@ -125,12 +132,26 @@ class Categorical(Parameter):
             res = res.sample()
         return res
 
-    def sample(self):
-        res = np.random.choice(self["choices"])
+    def sample(self, rng=None):
+        rng = get_rng(rng)
+        res = self["choices"][rng.integers(len(self["choices"]))]
         if isinstance(res, Constant):
             res = res.sample()
         return res
 
+    def sample_batch(self, n, rng=None):
+        rng = get_rng(rng)
+        choices = [c.sample() if isinstance(c, Constant) else c
+                   for c in self["choices"]]
+        if len(set(type(c) for c in choices)) == 1:
+            values = np.array(choices)
+        else:
+            # keep mixed choices as they are instead of letting numpy
+            # convert all of them to a common type
+            values = np.empty(len(choices), dtype=object)
+            values[:] = choices
+        return values[rng.integers(len(choices), size=n)]
+
     def valid(self, value):
         any_valid = False
         for choice in self["choices"]:
@@ -184,7 +205,8 @@ class UniformNumber(Parameter):
     def default(self):
         return self["default"]
 
-    def sample(self):
+    def sample(self, rng=None):
+        rng = get_rng(rng)
         mtype = str_to_types[self["type"]]
         if mtype not in [int, float]:
             err = "Invalid type: {} for UniformNumber"
@@ -199,11 +221,35 @@ class UniformNumber(Parameter):
             mmin = np.log(np.maximum(mmin, 1e-7))
             mmax = np.log(mmax)
 
-        nr = np.random.uniform(mmin, mmax)
+        nr = rng.uniform(mmin, mmax)
         if self['log_scale']:
             nr = np.exp(nr)
         return mtype(nr)
 
+    def sample_batch(self, n, rng=None):
+        rng = get_rng(rng)
+        mtype = str_to_types[self["type"]]
+        if mtype not in [int, float]:
+            err = "Invalid type: {} for UniformNumber"
+            raise ParamValueExcept(err.format(mtype))
+
+        mmin = mtype(self["lower"])
+        mmax = mtype(self["upper"])
+        if self["log_scale"]:
+            if mmin < 0. or mmax < 0.:
+                raise ParamValueExcept(
+                    "log_scale only allowed for positive ranges")
+            mmin = np.log(np.maximum(mmin, 1e-7))
+            mmax = np.log(mmax)
+
+        nr = rng.uniform(mmin, mmax, size=n)
+        if self['log_scale']:
+            nr = np.exp(nr)
+        if mtype == int:
+            # same rounding as int() in sample()
+            return np.trunc(nr).astype(int)
+        return nr
+
     def valid(self, value):
         return self["lower"] <= value <= self["upper"]
 
@@ -288,17 +334,27 @@ class Gaussian(Parameter):
     def default(self):
         return self["mu"]
 
-    def sample(self):
+    def sample(self, rng=None):
+        rng = get_rng(rng)
         mtype = str_to_types[self["type"]]
         mu = self["mu"]
         sigma = self["sigma"]
-        if not (type == float):
+        if not (mtype == float):
             raise ParamValueExcept("Parameter with normal distribution"
                                    " must be float!")
         if self["log_scale"]:
-            return np.random.lognormal(mtype(mu), mtype(sigma))
+            return float(rng.lognormal(mtype(mu), mtype(sigma)))
         else:
-            return np.random.normal(mtype(mu), mtype(sigma))
+            return float(rng.normal(mtype(mu), mtype(sigma)))
+
+    def sample_batch(self, n, rng=None):
+        rng = get_rng(rng)
+        mu = float(self["mu"])
+        sigma = float(self["sigma"])
+        if self["log_scale"]:
+            return rng.lognormal(mu, sigma, size=n)
+        else:
+            return rng.normal(mu, sigma, size=n)
 
     def valid(self, value):
         return isinstance(value, (float,) + integer_types)
@@ -329,13 +385,35 @@ class ConditionResult(Parameter):
         else:
             return None
 
-    def sample(self, condition_res):
+    def sample(self, condition_res, rng=None):
         condition_true = self["condition"].sample(condition_res)
         if condition_true:
-            return self["result"].sample()
+            return self["result"].sample(rng)
         else:
             return None
 
+    def sample_batch(self, condition_res, rng=None):
+        """
+        Sample values for a batch of configurations.
+
+        Parameters
+        ----------
+        condition_res : np.ndarray
+            The values of the parameter this one is conditioned on, inactive
+            values have to be masked.
+        rng : numpy.random.Generator, optional
+            The random number generator to sample from.
+
+        Returns
+        -------
+        np.ma.MaskedArray
+            The sampled values, which are masked wherever the condition
+            is not satisfied.
+        """
+        active = self["condition"].sample_batch(condition_res)
+        values = self["result"].sample_batch(len(active), rng)
+        return np.ma.masked_array(values, mask=~active)
+
     def valid(self, value):
         return self["result"].valid(value)
 
@@ -376,6 +454,16 @@ class Condition(ParameterOperation):
                 return True
         return False
 
+    def sample_batch(self, cres):
+        values = np.empty(len(cres), dtype=object)
+        values[:] = np.ma.getdata(cres)
+        active = np.zeros(len(cres), dtype=bool)
+        for choice in self["choices"]:
+            if isinstance(choice, Constant):
+                choice = choice["value"]
+            active |= (values == choice)
+        return active & ~np.ma.getmaskarray(cres)
+
     def valid(self, cres):
         return True
 
@@ -2,15 +2,141 @@
 # coding=utf-8
 from __future__ import division, print_function, unicode_literals
 
+import importlib
+
+from six import string_types
+
 from .base import Optimizer
-from .random_search import RandomSearch
 
-# try:
-#     from .smac import SMAC
-# except ImportError:
-#     print('WARNING: SMAC not found')
+# entry point group through which other packages can provide optimizers
+ENTRY_POINT_GROUP = 'labwatch.optimizers'
+
+# Optimizers are only imported when they are accessed, such that importing
+# labwatch does not pay for (or warn about) backends that are not used.
+_lazy_optimizers = {
+    'RandomSearch': 'labwatch.optimizers.random_search',
+    'BayesianOptimization': 'labwatch.optimizers.bayesian_optimization',
+    'Bohamiann': 'labwatch.optimizers.bohamiann',
+    'DNGOWrapper': 'labwatch.optimizers.dngo',
+    'SMAC': 'labwatch.optimizers.smac_wrapper',
+    'TPE': 'labwatch.optimizers.tpe',
+}
+
+# optimizers added with register_optimizer(), maps the lowercased name to
+# the name as given and the optimizer
+_registry = dict()
+
+__all__ = ['Optimizer', 'get_optimizer', 'register_optimizer',
+           'list_optimizers'] + sorted(_lazy_optimizers)
+
+
+def __getattr__(name):
+    if name in _lazy_optimizers:
+        module = importlib.import_module(_lazy_optimizers[name])
+        cls = getattr(module, name)
+        globals()[name] = cls
+        return cls
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__,
+                                                                   name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_optimizers))
+
+
+def _entry_points():
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return []
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        return list(eps.select(group=ENTRY_POINT_GROUP))
+    return list(eps.get(ENTRY_POINT_GROUP, []))
+
+
+def register_optimizer(name, optimizer):
+    """
+    Make an optimizer available under the given name.
+
+    Parameters
+    ----------
+    name: str
+        Name of the optimizer, case-insensitive.
+    optimizer: type or str
+        An Optimizer subclass or its import path in the form
+        "package.module.Class".
+    """
+    _registry[name.lower()] = (name, optimizer)
+
+
+def list_optimizers():
+    """The names of all optimizers that get_optimizer() can resolve."""
+    # the lookup is case-insensitive, list every optimizer once under the
+    # name that get_optimizer() resolves first
+    names = {ep.name.lower(): ep.name for ep in _entry_points()}
+    names.update((name.lower(), name) for name in _lazy_optimizers)
+    names.update((key, name) for key, (name, _) in _registry.items())
+    return sorted(names.values())
+
+
+def _import_path(path):
+    module_name, _, attr = path.replace(':', '.').rpartition('.')
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def get_optimizer(optimizer):
+    """
+    Look up an optimizer class without importing any other backend.
+
+    Names are looked up case-insensitively among the optimizers of labwatch,
+    those added with register_optimizer() and the entry points of the group
+    "labwatch.optimizers". Names with a dot are imported as
+    "package.module.Class".
+
+    Parameters
+    ----------
+    optimizer: str or type
+        The name of the optimizer. Classes are returned as they are.
+
+    Returns
+    -------
+    type
+        The Optimizer subclass.
+
+    Raises
+    ------
+    KeyError
+        If there is no optimizer of the given name.
+    TypeError
+        If the name resolves to something else than an Optimizer subclass.
+    """
+    if not isinstance(optimizer, string_types):
+        cls = optimizer
+    else:
+        cls = _resolve(optimizer)
+    if not (isinstance(cls, type) and issubclass(cls, Optimizer)):
+        raise TypeError("{!r} is not a subclass of {}.Optimizer".format(
+            cls, __name__))
+    return cls
+
 
-try:
-    from .bayesian_optimization import BayesianOptimization
-except ImportError:
-    print('WARNING: BayesianOptimization not found')
+def _resolve(optimizer):
+    name = optimizer.lower()
+    if name in _registry:
+        cls = _registry[name][1]
+    else:
+        builtin = {n.lower(): n for n in _lazy_optimizers}
+        if name in builtin:
+            return __getattr__(builtin[name])
+        eps = [ep for ep in _entry_points() if ep.name.lower() == name]
+        if eps:
+            cls = eps[0].load()
+        elif '.' in optimizer or ':' in optimizer:
+            cls = optimizer
+        else:
+            raise KeyError("Unknown optimizer {!r}, available are: {}".format(
+                optimizer, ", ".join(list_optimizers())))
+    if isinstance(cls, string_types):
+        cls = _import_path(cls)
+    return cls
@@ -1,19 +1,44 @@
 
 import numpy as np
 
-from labwatch.converters.convert_to_configspace import sacred_config_to_configspace
+from labwatch.converters.convert_to_vector import VectorEncoder
+from labwatch.utils.observations import ObservationBuffer
+from labwatch.utils.rng import get_rng
 
 
 class Optimizer(object):
     """Defines the interface for all optimizers."""
 
-    def __init__(self, config_space):
+    def __init__(self, config_space, rng=None):
         self.config_space = config_space
-        self.X = None
-        self.y = None
+        self.rng = get_rng(rng)
+        self.observations = ObservationBuffer()
+        self.pending = []
+        self._encoder = None
+
+    @property
+    def X(self):
+        """All observed configurations mapped to [0, 1]^D or None."""
+        return self.observations.X
+
+    @property
+    def y(self):
+        """The costs of all observed configurations or None."""
+        return self.observations.y
+
+    @property
+    def encoder(self):
+        """Maps configurations of the search space to vectors and back."""
+        if self._encoder is None:
+            self._encoder = VectorEncoder(self.config_space)
+        return self._encoder
+
+    def _encode(self, configs):
+        """Maps a list of configurations to an array of vectors."""
+        return self.encoder.encode(configs)
 
     def get_random_config(self):
-        return self.config_space.sample()
+        return self.config_space.sample(rng=self.rng)
 
     def get_default_config(self):
         return self.config_space.default()
@@ -33,6 +58,59 @@ class Optimizer(object):
         """
         return None
 
+    def suggest_configurations(self, n):
+        """Suggests n configurations of hyperparameters to be run in parallel.
+
+        The default implementation asks suggest_configuration() n times and
+        marks every suggestion as pending before requesting the next one.
+        Model based optimizers should override this such that their model is
+        fitted only once per batch.
+
+        Parameters
+        ----------
+        n: int
+            Number of configurations to suggest.
+
+        Returns
+        -------
+        list[dict]:
+            List of dictionaries mapping parameter names to suggested values.
+        """
+        pending = self.pending
+        configs = []
+        try:
+            for _ in range(n):
+                configs.append(self.suggest_configuration())
+                self.pending = pending + configs
+        finally:
+            self.pending = pending
+        return configs
+
+    def set_pending(self, configs):
+        """
+        Inform the optimizer about configurations that are currently
+        being evaluated, such that it does not suggest them again.
+
+        Parameters
+        ----------
+        configs: list[dict]
+            List of configurations mapping parameter names to values.
+        """
+        self.pending = list(configs)
+
+    def _fantasize_pending(self):
+        """
+        Returns the observations extended by the pending configurations.
+        Their outcome is fantasized with the best cost seen so far
+        (constant liar) which pushes new suggestions away from them.
+        """
+        if not self.pending or self.X is None or self.y is None:
+            return self.X, self.y
+        X_pending = self._encode(self.pending)
+        y_pending = np.ones(X_pending.shape[0]) * np.min(self.y)
+        return (np.append(self.X, X_pending, axis=0),
+                np.append(self.y, y_pending, axis=0))
+
     def update(self, configs, costs, runs):
         """
         Update the internal state of the optimizer with a list of new results.
@@ -45,22 +123,53 @@ class Optimizer(object):
             List of costs associated to each config.
         runs: list[dict]
             List of dictionaries containing additional run information.
+
+        Returns
+        -------
+        dict or None:
+            Optionally a dictionary mapping the _id of runs to a dictionary
+            with the fields of the run's info that should be changed.
         """
 
-        converted_configs = [
-            sacred_config_to_configspace(self.config_space, config)
-            for config in configs]
+        if len(configs) == 0:
+            return
+        # Maps configurations to [0, 1]^D space
+        self.observations.extend(self._encode(configs), costs)
+
+    def get_state(self):
+        """
+        Returns everything the optimizer learned so far such that a new
+        instance can continue where this one stopped, see set_state().
 
-        for (config, cost) in zip(converted_configs, costs):
-            # Maps configuration to [0, 1]^D space
-            x = config.get_array()
+        Returns
+        -------
+        dict:
+            Dictionary of arrays, numbers and strings (see
+            labwatch.utils.checkpoint), the observations are stored as
+            X and y, the best one seen so far as incumbent.
+        """
+        state = {'X': None, 'y': None,
+                 'incumbent': None, 'incumbent_value': None}
+        if self.y is not None:
+            best = np.argmin(self.y)
+            state['X'] = self.X.copy()
+            state['y'] = self.y.copy()
+            state['incumbent'] = self.X[best].copy()
+            state['incumbent_value'] = float(self.y[best])
+        return state
+
+    def set_state(self, state):
+        """
+        Restores a state previously returned by get_state().
 
-            if self.X is None and self.y is None:
-                self.X = np.array([x])
-                self.y = np.array([cost])
-            elif x not in self.X:
-                self.X = np.append(self.X, x[np.newaxis, :], axis=0)
-                self.y = np.append(self.y, np.array([cost]), axis=0)
+        Parameters
+        ----------
+        state: dict
+            The state of an optimizer for the same search space.
+        """
+        self.observations = ObservationBuffer()
+        if state.get('X') is not None:
+            self.observations.extend(state['X'], state['y'])
 
     def needs_updates(self):
         """
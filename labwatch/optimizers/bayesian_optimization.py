@@ -3,95 +3,197 @@
 from __future__ import division, print_function, unicode_literals
 
 import numpy as np
-from ConfigSpace import Configuration
-try:
-    import george
-    from robo.priors.default_priors import DefaultPrior
-    from robo.models.gaussian_process_mcmc import GaussianProcessMCMC
-    from robo.maximizers.direct import Direct
-    from robo.acquisition_functions.log_ei import LogEI
-    from robo.acquisition_functions.marginalization import MarginalizationGPMCMC
-    from robo.initial_design.init_random_uniform import init_random_uniform
-except ImportError as e:
-    print("If you want to use BayesianOptimization you have to install the following dependencies:\n"
-                     "https://github.com/automl/RoBO\n"
-                     "george")
+
 from labwatch.optimizers.base import Optimizer
-from labwatch.converters.convert_to_configspace import sacred_space_to_configspace, configspace_config_to_sacred
 from labwatch.utils.types import SearchSpaceNotSupported
+from labwatch.utils.rng import get_random_state
+
+
+def _import_robo():
+    # RoBO and george are slow to import, only load them once an optimizer
+    # is actually created
+    global george, DefaultPrior, GaussianProcessMCMC, Direct, LogEI, \
+        MarginalizationGPMCMC, init_random_uniform
+    try:
+        import george
+        from robo.priors.default_priors import DefaultPrior
+        from robo.models.gaussian_process_mcmc import GaussianProcessMCMC
+        from robo.maximizers.direct import Direct
+        from robo.acquisition_functions.log_ei import LogEI
+        from robo.acquisition_functions.marginalization import \
+            MarginalizationGPMCMC
+        from robo.initial_design.init_random_uniform import init_random_uniform
+    except ImportError:
+        raise ImportError("If you want to use BayesianOptimization you have "
+                          "to install the following dependencies:\n"
+                          "https://github.com/automl/RoBO\n"
+                          "george")
 
 
 class BayesianOptimization(Optimizer):
 
     def __init__(self, config_space, burnin=100, chain_length=200,
-                 n_hypers=20):
+                 n_hypers=20, incremental_chain_length=None,
+                 refit_every=None, rng=None):
+        """
+        Parameters
+        ----------
+        config_space: labwatch.searchspace.SearchSpace
+            The search space, must only contain numerical parameters.
+        burnin: int
+            Number of MCMC steps to burn in the GP hyperparameters, this is
+            only done for the first fit and for every full refit.
+        chain_length: int
+            Number of MCMC steps after the burn-in.
+        n_hypers: int
+            Number of walkers, i.e. GP hyperparameter samples.
+        incremental_chain_length: int, optional
+            Number of MCMC steps when the chain continues from the walker
+            positions of the previous fit. Defaults to chain_length.
+        refit_every: int, optional
+            Burn in again from the prior after this many new observations.
+            By default the chain is always continued.
+        rng: int or numpy.random.Generator, optional
+            Seed or random number generator.
+        """
 
         if config_space.has_categorical:
             raise SearchSpaceNotSupported("GP-based Bayesian optimization only supports numerical hyperparameters.")
+        _import_robo()
 
-        super(BayesianOptimization, self).__init__(config_space)
-        self.rng = np.random.RandomState(np.random.seed())
+        super(BayesianOptimization, self).__init__(config_space, rng)
+        # RoBO requires a legacy RandomState
+        self.random_state = get_random_state(self.rng)
 
         self.burnin = burnin
         self.chain_length = chain_length
         self.n_hypers = n_hypers
-
-        self.config_space = sacred_space_to_configspace(config_space)
-
-        n_inputs = len(self.config_space.get_hyperparameters())
+        if incremental_chain_length is None:
+            incremental_chain_length = chain_length
+        self.incremental_chain_length = incremental_chain_length
+        self.refit_every = refit_every
+        # last positions of the MCMC walkers over the GP hyperparameters,
+        # once known the chain can start there and skip the burn-in
+        self.p0 = None
+        # number of observations at the last full refit
+        self.n_refit = 0
+        # the model is kept across calls and built on first use
+        self.model = None
+        self.acquisition_func = None
+        self.max_func = None
+
+        n_inputs = self.encoder.n_dims
 
         self.lower = np.zeros([n_inputs])
         self.upper = np.ones([n_inputs])
 
-        self.X = None
-        self.y = None
+
+    def _build_model(self):
+        cov_amp = 1
+        n_dims = self.lower.shape[0]
+
+        initial_ls = np.ones([n_dims])
+        exp_kernel = george.kernels.Matern52Kernel(initial_ls,
+                                                   ndim=n_dims)
+        kernel = cov_amp * exp_kernel
+
+        prior = DefaultPrior(len(kernel) + 1)
+
+        model = GaussianProcessMCMC(kernel, prior=prior,
+                                    n_hypers=self.n_hypers,
+                                    chain_length=self.chain_length,
+                                    burnin_steps=self.burnin,
+                                    normalize_input=False,
+                                    normalize_output=True,
+                                    rng=self.random_state,
+                                    lower=self.lower,
+                                    upper=self.upper)
+
+        a = LogEI(model)
+
+        acquisition_func = MarginalizationGPMCMC(a)
+
+        max_func = Direct(acquisition_func, self.lower, self.upper,
+                          verbose=False)
+
+        return model, acquisition_func, max_func
+
+    def get_state(self):
+        state = super(BayesianOptimization, self).get_state()
+        state['p0'] = self.p0
+        state['n_refit'] = self.n_refit
+        return state
+
+    def set_state(self, state):
+        super(BayesianOptimization, self).set_state(state)
+        self.p0 = state.get('p0')
+        self.n_refit = state.get('n_refit', 0)
+
+    def _train(self, X, y):
+        """
+        Trains the model, continuing the MCMC chain of the previous fit if
+        possible instead of burning in from the prior again.
+        """
+        if self.model is None:
+            (self.model, self.acquisition_func,
+             self.max_func) = self._build_model()
+        model = self.model
+        warm = self.p0 is not None and self.p0.shape[0] == self.n_hypers
+        if warm and self.refit_every is not None:
+            warm = X.shape[0] - self.n_refit < self.refit_every
+        if warm:
+            model.p0 = self.p0
+            model.burned = True
+            model.chain_length = self.incremental_chain_length
+        else:
+            model.burned = False
+            model.chain_length = self.chain_length
+            self.n_refit = X.shape[0]
+        model.train(X, y)
+        self.p0 = model.p0
+        return model
 
     def suggest_configuration(self):
+        return self.suggest_configurations(1)[0]
+
+    def suggest_configurations(self, n):
         if self.X is None and self.y is None:
             new_x = init_random_uniform(self.lower, self.upper,
-                                        n_points=1, rng=self.rng)[0, :]
+                                        n_points=n, rng=self.random_state)
 
         elif self.X.shape[0] == 1:
             # We need at least 2 data points to train a GP
             new_x = init_random_uniform(self.lower, self.upper,
-                                        n_points=1, rng=self.rng)[0, :]
+                                        n_points=n, rng=self.random_state)
 
         else:
-            cov_amp = 1
-            n_dims = self.lower.shape[0]
-
-            initial_ls = np.ones([n_dims])
-            exp_kernel = george.kernels.Matern52Kernel(initial_ls,
-                                                       ndim=n_dims)
-            kernel = cov_amp * exp_kernel
-
-            prior = DefaultPrior(len(kernel) + 1)
-
-            model = GaussianProcessMCMC(kernel, prior=prior,
-                                        n_hypers=self.n_hypers,
-                                        chain_length=self.chain_length,
-                                        burnin_steps=self.burnin,
-                                        normalize_input=False,
-                                        normalize_output=True,
-                                        rng=self.rng,
-                                        lower=self.lower,
-                                        upper=self.upper)
-
-            a = LogEI(model)
-
-            acquisition_func = MarginalizationGPMCMC(a)
-
-            max_func = Direct(acquisition_func, self.lower, self.upper, verbose=False)
-
-            model.train(self.X, self.y)
-
-            acquisition_func.update(model)
-
-            new_x = max_func.maximize()
-
-        next_config = Configuration(self.config_space, vector=new_x)
-
-        # Transform to sacred configuration
-        result = configspace_config_to_sacred(next_config)
-
-        return result
+            model = self._train(self.X, self.y)
+            acquisition_func, max_func = self.acquisition_func, self.max_func
+
+            # Kriging believer: pending runs and every selected point are
+            # added with the predicted mean as fantasized outcome before the
+            # next point is selected. The GP hyperparameters were already
+            # sampled above, their chain is only advanced by a single step
+            # per fantasy.
+            X, y = self.X, self.y
+            fantasies = list(self._encode(self.pending))
+            new_x = []
+            chain_length = model.chain_length
+            model.chain_length = 1
+            try:
+                while len(new_x) < n:
+                    if len(fantasies) > 0:
+                        fantasies = np.array(fantasies)
+                        mean, _ = model.predict(fantasies)
+                        X = np.append(X, fantasies, axis=0)
+                        y = np.append(y, mean, axis=0)
+                        model.train(X, y)
+
+                    acquisition_func.update(model)
+                    new_x.append(max_func.maximize())
+                    fantasies = [new_x[-1]]
+            finally:
+                model.chain_length = chain_length
+
+        # Map from [0, 1]^D space back to the search space
+        return self.encoder.decode(np.array(new_x))
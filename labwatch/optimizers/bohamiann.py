@@ -4,35 +4,37 @@ from __future__ import division, print_function, unicode_literals
 
 import numpy as np
 
-
-from ConfigSpace import Configuration
-try:
-    from robo.initial_design.init_random_uniform import init_random_uniform
-    from robo.models.bnn import BayesianNeuralNetwork
-    from robo.maximizers.direct import Direct
-    from robo.acquisition_functions.log_ei import LogEI
-except:
-    print("If you want to use Bohamiann you have to install the following dependencies:\n"
-                     "RoBO (https://github.com/automl/RoBO)")
 from labwatch.optimizers.base import Optimizer
-from labwatch.converters.convert_to_configspace import (
-    sacred_space_to_configspace, configspace_config_to_sacred)
+from labwatch.utils.rng import get_random_state
 
 
-class Bohamiann(Optimizer):
+def _import_robo():
+    # RoBO is slow to import, only load it once an optimizer is created
+    global init_random_uniform, BayesianNeuralNetwork, Direct, LogEI
+    try:
+        from robo.initial_design.init_random_uniform import init_random_uniform
+        from robo.models.bnn import BayesianNeuralNetwork
+        from robo.maximizers.direct import Direct
+        from robo.acquisition_functions.log_ei import LogEI
+    except ImportError:
+        raise ImportError("If you want to use Bohamiann you have to install "
+                          "the following dependencies:\n"
+                          "RoBO (https://github.com/automl/RoBO)")
+
 
-    def __init__(self, config_space, burnin=3000, n_iters=10000):
+class Bohamiann(Optimizer):
 
-        super(Bohamiann, self).__init__(sacred_space_to_configspace(config_space))
-        self.rng = np.random.RandomState(np.random.seed())
-        self.n_dims = len(self.config_space.get_hyperparameters())
+    def __init__(self, config_space, burnin=3000, n_iters=10000, rng=None):
+        _import_robo()
+        super(Bohamiann, self).__init__(config_space, rng)
+        # RoBO requires a legacy RandomState
+        self.random_state = get_random_state(self.rng)
+        self.n_dims = self.encoder.n_dims
 
         # All inputs are mapped to be in [0, 1]^D
         self.lower = np.zeros([self.n_dims])
         self.upper = np.ones([self.n_dims])
         self.incumbents = []
-        self.X = None
-        self.y = None
 
         self.model = BayesianNeuralNetwork(sampling_method="sghmc",
                                            l_rate=np.sqrt(1e-4),
@@ -51,21 +53,17 @@ class Bohamiann(Optimizer):
 
         if self.X is None and self.y is None:
             # No data points yet to train a model, just return a random configuration instead
-            new_x = init_random_uniform(self.lower, self.upper,
-                                        n_points=1, rng=self.rng)[0, :]
+            new_x = init_random_uniform(self.lower, self.upper, n_points=1,
+                                        rng=self.random_state)[0, :]
 
         else:
-            # Train the model on all finished runs
-            self.model.train(self.X, self.y)
+            # Train the model on all finished and pending runs
+            X, y = self._fantasize_pending()
+            self.model.train(X, y)
             self.acquisition_func.update(self.model)
 
             # Maximize the acquisition function
             new_x = self.maximizer.maximize()
 
         # Maps from [0, 1]^D space back to original space
-        next_config = Configuration(self.config_space, vector=new_x)
-
-        # Transform to sacred configuration
-        result = configspace_config_to_sacred(next_config)
-
-        return result
+        return self.encoder.decode(new_x)[0]
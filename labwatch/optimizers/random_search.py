@@ -4,11 +4,24 @@ from labwatch.optimizers import Optimizer
 
 class RandomSearch(Optimizer):
 
-    def __init__(self, config_space):
-        super(RandomSearch, self).__init__(config_space)
+    def __init__(self, config_space, rng=None):
+        super(RandomSearch, self).__init__(config_space, rng)
 
-    def suggest_configuration(self):
-        return self.get_random_config()
+    def suggest_configuration(self, max_tries=100):
+        # do not hand out configurations that are currently evaluated
+        pending = {tuple(sorted(config.items())) for config in self.pending}
+        for _ in range(max_tries):
+            config = self.get_random_config()
+            if tuple(sorted(config.items())) not in pending:
+                break
+        return config
+
+    def suggest_configurations(self, n):
+        pending = {tuple(sorted(config.items())) for config in self.pending}
+        configs = self.config_space.sample_batch(n, rng=self.rng).to_dicts()
+        return [config if tuple(sorted(config.items())) not in pending
+                else self.suggest_configuration()
+                for config in configs]
 
     def update(self, configs, costs, run_info):
         pass
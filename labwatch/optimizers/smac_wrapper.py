@@ -3,85 +3,112 @@
 from __future__ import division, print_function, unicode_literals
 
 import numpy as np
-try:
-    from smac.scenario.scenario import Scenario
-    from smac.tae.execute_ta_run import StatusType
-    from smac.facade import smac_facade
-except:
-    print("If you want to use LabwatchScenario you have to install the following dependencies:\n"
-                     "SMAC (https://github.com/automl/SMAC3)")
+
 from labwatch.optimizers.base import Optimizer
 from labwatch.converters.convert_to_configspace import (
     sacred_space_to_configspace, sacred_config_to_configspace,
     configspace_config_to_sacred)
-
-
-class LabwatchScenario(Scenario):
-    """
-    Specialize the smac3 scenario here since we want to create
-    everything within code without reading a smac scenario file.
-    """
-
-    def __init__(self, config_space, logger):
-        self.logger = logger
-        # we don't actually have a target algorithm here
-        # we will implement algorithm calling and the SMBO loop ourselves
-        self.ta = None
-        self.execdir = None
-        self.pcs_fn = None
-        self.run_obj = 'quality'
-        self.overall_obj = self.run_obj
-
-        # Time limits for smac
-        # these will never be used since we call
-        # smac.choose_next() manually
-        self.cutoff = None
-        self.algo_runs_timelimit = None
-        self.wallclock_limit = None
-
-        # no instances
-        self.train_inst_fn = None
-        self.test_inst_fn = None
-        self.feature_fn = None
-        self.train_insts = []
-        self.test_inst = []
-        self.feature_dict = {}
-        self.feature_array = None
-        self.instance_specific = None
-        self.n_features = 0
-
-        # save reference to config_space
-        self.cs = config_space
-        
-        # We do not need a TAE Runner as this is done by the Sacred Experiment
-        self.tae_runner = None
-        self.deterministic = False
+from labwatch.utils.rng import get_rng
+
+
+def _import_smac():
+    # SMAC is an optional dependency, it is only needed once an optimizer
+    # is actually created
+    global Scenario, StatusType, smac_facade, LabwatchScenario
+    try:
+        from smac.scenario.scenario import Scenario
+        from smac.tae.execute_ta_run import StatusType
+        from smac.facade import smac_facade
+    except ImportError:
+        raise ImportError("If you want to use SMAC you have to install the "
+                          "following dependencies:\n"
+                          "SMAC (https://github.com/automl/SMAC3)")
+    LabwatchScenario = _labwatch_scenario(Scenario)
+
+
+def _labwatch_scenario(Scenario):
+    # the base class is only known once SMAC was imported
+
+    class LabwatchScenario(Scenario):
+        """
+        Specialize the smac3 scenario here since we want to create
+        everything within code without reading a smac scenario file.
+        """
+
+        def __init__(self, config_space, logger):
+            self.logger = logger
+            # we don't actually have a target algorithm here
+            # we will implement algorithm calling and the SMBO loop ourselves
+            self.ta = None
+            self.execdir = None
+            self.pcs_fn = None
+            self.run_obj = 'quality'
+            self.overall_obj = self.run_obj
+
+            # Time limits for smac
+            # these will never be used since we call
+            # smac.choose_next() manually
+            self.cutoff = None
+            self.algo_runs_timelimit = None
+            self.wallclock_limit = None
+
+            # no instances
+            self.train_inst_fn = None
+            self.test_inst_fn = None
+            self.feature_fn = None
+            self.train_insts = []
+            self.test_inst = []
+            self.feature_dict = {}
+            self.feature_array = None
+            self.instance_specific = None
+            self.n_features = 0
+
+            # save reference to config_space
+            self.cs = config_space
+
+            # We do not need a TAE Runner as this is done by the Sacred
+            # Experiment
+            self.tae_runner = None
+            self.deterministic = False
+
+    return LabwatchScenario
 
 
 class SMAC(Optimizer):
-    def __init__(self, config_space, seed=None):
+    def __init__(self, config_space, seed=None, rng=None):
+        _import_smac()
 
+        rng = get_rng(rng)
         if seed is None:
-            self.seed = np.random.randint(0, 10000)
+            self.seed = int(rng.integers(0, 10000))
         else:
             self.seed = seed
 
-        self.rng = np.random.RandomState(self.seed)
-
-        super(SMAC, self).__init__(sacred_space_to_configspace(config_space))
+        super(SMAC, self).__init__(
+            sacred_space_to_configspace(config_space, rng), rng)
+        # SMAC requires a legacy RandomState
+        self.random_state = np.random.RandomState(self.seed)
 
         self.scenario = Scenario({"run_obj": "quality",
                                   "cs": self.config_space,
                                   "deterministic": "true"})
         self.solver = smac_facade.SMAC(scenario=self.scenario,
-                                       rng=self.rng)
+                                       rng=self.random_state)
+
+    def _encode(self, configs):
+        # SMAC works on the vector representation of ConfigSpace
+        return np.array([
+            sacred_config_to_configspace(self.config_space, config).get_array()
+            for config in configs])
 
     def suggest_configuration(self):
         if self.X is None and self.y is None:
             next_config = self.config_space.sample_configuration()
 
         else:
-            l = list(self.solver.solver.choose_next(self.X, self.y[:, None], incumbent_value=np.min(self.y)))
+            X, y = self._fantasize_pending()
+            l = list(self.solver.solver.choose_next(
+                X, y[:, None], incumbent_value=np.min(self.y)))
             next_config = l[0]
 
         result = configspace_config_to_sacred(next_config)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# coding=utf-8
+from __future__ import division, print_function, unicode_literals
+
+import numpy as np
+
+from labwatch.hyperparameters import Constant, Categorical, Gaussian
+from labwatch.optimizers.base import Optimizer
+
+
+def _norm_cdf(z):
+    # Abramowitz and Stegun 7.1.26, the absolute error is below 1.5e-7
+    # which is plenty for normalizing the truncated kernels
+    x = np.abs(z) / np.sqrt(2.)
+    t = 1. / (1. + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (
+        1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1. - poly * np.exp(-x * x)
+    return 0.5 * (1. + np.sign(z) * erf)
+
+
+def _logsumexp(a, axis):
+    a_max = np.max(a, axis=axis, keepdims=True)
+    return np.log(np.sum(np.exp(a - a_max), axis=axis)) + \
+        np.squeeze(a_max, axis=axis)
+
+
+class ParzenEstimator(object):
+    """
+    Mixture of one Gaussian kernel per observation and a broad prior
+    kernel, optionally truncated to [low, high].
+
+    The bandwidth of every kernel is the larger distance to its neighbours,
+    clipped such that it neither collapses nor exceeds the prior.
+    """
+
+    def __init__(self, mus, prior_mu, prior_sigma, prior_weight,
+                 low=None, high=None):
+        self.low = low
+        self.high = high
+        mus = np.append(np.asarray(mus, dtype=float), prior_mu)
+        order = np.argsort(mus)
+        sorted_mus = mus[order]
+        # distances to the neighbours, the bounds close the outer kernels
+        lower_edge = sorted_mus[0] if low is None else low
+        upper_edge = sorted_mus[-1] if high is None else high
+        left = np.diff(np.append(lower_edge, sorted_mus))
+        right = np.diff(np.append(sorted_mus, upper_edge))
+        sigmas = np.empty_like(mus)
+        sigmas[order] = np.maximum(left, right)
+        sigmas = np.clip(sigmas, prior_sigma / min(100., len(mus)),
+                         prior_sigma)
+        sigmas[-1] = prior_sigma
+
+        weights = np.ones_like(mus)
+        weights[-1] = prior_weight
+        self.mus = mus
+        self.sigmas = sigmas
+        self.weights = weights / weights.sum()
+        if low is None:
+            self.log_norm = np.zeros_like(mus)
+        else:
+            mass = (_norm_cdf((high - mus) / sigmas) -
+                    _norm_cdf((low - mus) / sigmas))
+            self.log_norm = np.log(np.maximum(mass, 1e-12))
+
+    def sample(self, n, rng):
+        components = rng.choice(len(self.mus), size=n, p=self.weights)
+        mus, sigmas = self.mus[components], self.sigmas[components]
+        x = rng.normal(mus, sigmas)
+        if self.low is None:
+            return x
+        # rejection sampling of the truncated kernels
+        for _ in range(100):
+            outside = (x < self.low) | (x > self.high)
+            if not outside.any():
+                break
+            x[outside] = rng.normal(mus[outside], sigmas[outside])
+        return np.clip(x, self.low, self.high)
+
+    def log_pdf(self, x):
+        z = (x[:, np.newaxis] - self.mus) / self.sigmas
+        log_kernels = (-0.5 * z ** 2 - np.log(self.sigmas) -
+                       0.5 * np.log(2 * np.pi) - self.log_norm +
+                       np.log(self.weights))
+        return _logsumexp(log_kernels, axis=1)
+
+
+class CategoricalEstimator(object):
+    """Smoothed frequencies of the choices of a categorical parameter."""
+
+    def __init__(self, indices, n_choices, prior_weight):
+        counts = np.bincount(np.asarray(indices, dtype=int),
+                             minlength=n_choices).astype(float)
+        counts += prior_weight / n_choices
+        self.probs = counts / counts.sum()
+
+    def sample(self, n, rng):
+        return rng.choice(len(self.probs), size=n,
+                          p=self.probs).astype(float)
+
+    def log_pdf(self, x):
+        return np.log(self.probs[x.astype(int)])
+
+
+class TPE(Optimizer):
+
+    def __init__(self, config_space, n_startup=10, gamma=0.25,
+                 max_good=25, n_candidates=24, prior_weight=1.0, rng=None):
+        """
+        Tree-structured Parzen Estimator (Bergstra et al., 2011).
+
+        The observations are split into the best gamma-quantile (at most
+        max_good configurations) and the rest, and the configurations are
+        modelled by one density l(x) for the good and one density g(x) for
+        the bad ones. Candidates are sampled from l(x) and the one
+        maximizing l(x) / g(x) is suggested. Every parameter has its own
+        density, which works on the vector encoding of the search space and
+        supports categorical and conditional parameters.
+
+        Parameters
+        ----------
+        config_space: labwatch.searchspace.SearchSpace
+            The search space.
+        n_startup: int
+            Number of observations before which configurations are sampled
+            randomly from the search space.
+        gamma: float
+            Fraction of the observations that are considered good.
+        max_good: int
+            Upper bound on the number of good observations, such that l(x)
+            stays focused and the other choices of categorical parameters
+            keep being explored.
+        n_candidates: int
+            Number of candidates sampled from l(x) per suggestion.
+        prior_weight: float
+            Weight of the prior in both densities.
+        rng: int or numpy.random.Generator, optional
+            Seed or random number generator.
+        """
+        super(TPE, self).__init__(config_space, rng)
+        self.n_startup = n_startup
+        self.gamma = gamma
+        self.max_good = max_good
+        self.n_candidates = n_candidates
+        self.prior_weight = prior_weight
+
+    def _estimator(self, j, values):
+        param = self.encoder.params[j]
+        if isinstance(param, Categorical):
+            return CategoricalEstimator(values, len(param["choices"]),
+                                        self.prior_weight)
+        elif isinstance(param, Gaussian):
+            # the encoding is standardized, the prior is N(0, 1)
+            return ParzenEstimator(values, 0., 1., self.prior_weight)
+        return ParzenEstimator(values, 0.5, 1., self.prior_weight,
+                               low=0., high=1.)
+
+    def _split(self):
+        """
+        Returns the encoded good and bad configurations. Pending
+        configurations count as bad such that they are not suggested again.
+        """
+        X, y = self.X, self.y
+        n_good = min(int(np.ceil(self.gamma * len(y))), self.max_good)
+        order = np.argsort(y, kind="mergesort")
+        X_good, X_bad = X[order[:n_good]], X[order[n_good:]]
+        if self.pending:
+            X_bad = np.append(X_bad, self._encode(self.pending), axis=0)
+        return X_good, X_bad
+
+    def suggest_configuration(self):
+        if self.y is None or len(self.y) < self.n_startup:
+            return self.get_random_config()
+
+        X_good, X_bad = self._split()
+        n_dims = self.encoder.n_dims
+        candidates = np.zeros([self.n_candidates, n_dims])
+        estimators = []
+        for j in range(n_dims):
+            if isinstance(self.encoder.params[j], Constant):
+                estimators.append(None)
+                continue
+            # inactive conditional parameters do not inform their density
+            good, bad = X_good[:, j], X_bad[:, j]
+            l = self._estimator(j, good[~np.isnan(good)])
+            g = self._estimator(j, bad[~np.isnan(bad)])
+            candidates[:, j] = l.sample(self.n_candidates, self.rng)
+            estimators.append((l, g))
+
+        # decoding rounds the values and drops inactive parameters, encode
+        # again to score exactly what would be suggested
+        configs = self.encoder.decode(candidates)
+        candidates = self._encode(configs)
+        scores = np.zeros(self.n_candidates)
+        for j, estimator in enumerate(estimators):
+            if estimator is None:
+                continue
+            active = ~np.isnan(candidates[:, j])
+            if active.any():
+                l, g = estimator
+                x = candidates[active, j]
+                scores[active] += l.log_pdf(x) - g.log_pdf(x)
+        return configs[int(np.argmax(scores))]
+
+    def needs_updates(self):
+        return True
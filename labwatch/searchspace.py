@@ -2,13 +2,59 @@
 # coding=utf-8
 from __future__ import division, print_function, unicode_literals
 
+import pickle
 import re
 
+import numpy as np
 from sacred.config import ConfigScope
 from sacred.utils import join_paths
 from labwatch.hyperparameters import Parameter, ConditionResult, Categorical
 from labwatch.hyperparameters import decode_param_or_op
 from labwatch.utils.types import InconsistentSpace, ParamValueExcept
+from labwatch.utils.rng import get_rng
+from labwatch.utils.hashing import hash_dict
+
+
+class ConfigBatch(object):
+    """
+    A batch of configurations stored column by column.
+
+    Every column is a numpy array holding the values of one parameter for
+    all configurations of the batch. Columns of conditional parameters are
+    masked arrays, a masked entry marks the parameter as inactive in the
+    corresponding configuration.
+    """
+
+    def __init__(self, columns, size):
+        self.columns = columns
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def names(self):
+        return list(self.columns.keys())
+
+    def is_active(self, name):
+        """Boolean array that is False wherever the parameter is inactive."""
+        return ~np.ma.getmaskarray(self.columns[name])
+
+    def to_dicts(self):
+        """
+        Convert the batch into a list of configurations as returned by
+        SearchSpace.sample(), inactive parameters are left out.
+        """
+        names = self.names
+        # tolist() converts to python types and masked entries to None
+        # which never is a valid value of a parameter
+        columns = [self.columns[name].tolist() for name in names]
+        return [{name: value for name, value in zip(names, row)
+                 if value is not None}
+                for row in zip(*columns)]
 
 
 class SearchSpace(object):
@@ -19,6 +65,9 @@ class SearchSpace(object):
         self._id = search_space.get('_id', None)
         if '_id' in search_space:
             del search_space['_id']
+        # the hash is stored alongside but is not part of the definition
+        if 'hash' in search_space:
+            del search_space['hash']
 
         self.search_space = search_space
         parameters = collect_hyperparameters(search_space)
@@ -42,10 +91,123 @@ class SearchSpace(object):
 
         self.contains_conditions = len(self.conditions) > 0
         self.validate_conditions()
+        self.hash = hash_dict(canonicalize_uids(search_space))
+        self._compile()
+
+    def _compile(self):
+        # precompute how to read the values of the parameters from a config
+        # and where to put them when filling in values
+        conditional = set(self.conditions)
+        self._accessors = [(name, compile_path(name), name in conditional)
+                           for name in sorted(self.parameters)]
+        conditional_uids = {self.parameters[name]['uid']
+                            for name in conditional}
+        slots, tuple_paths = [], []
+        template = _collect_slots(self.search_space, (), slots, tuple_paths)
+        self._template = pickle.dumps(template, pickle.HIGHEST_PROTOCOL)
+        self._slots = [(keys, uid, uid in conditional_uids)
+                       for keys, uid in slots]
+        # convert the innermost tuples first
+        self._tuple_paths = sorted(tuple_paths, key=len, reverse=True)
+
+    def fill(self, values):
+        """
+        Create a configuration by inserting values into the search space.
+
+        Equivalent to fill_in_values(search_space, values, fill_by='uid')
+        but the structure of the search space is only analyzed once.
+        Inactive conditional parameters are set to None.
+
+        Parameters
+        ----------
+        values : dict
+            A dictionary mapping uids to values.
+
+        Returns
+        -------
+        dict
+            The configuration.
+        """
+        # unpickling is a fast way to deep copy the template
+        config = pickle.loads(self._template)
+        for keys, uid, conditional in self._slots:
+            value = values.get(uid) if conditional else values[uid]
+            container = config
+            for key in keys[:-1]:
+                container = container[key]
+            container[keys[-1]] = value
+        for keys in self._tuple_paths:
+            container = config
+            for key in keys[:-1]:
+                container = container[key]
+            container[keys[-1]] = tuple(container[keys[-1]])
+        return config
+
+    def get_values(self, config):
+        """
+        Get the values of all parameters from a configuration.
+
+        Equivalent to get_values_from_config(config, self.parameters) but
+        inactive conditional parameters, which are missing or None in the
+        config, are left out.
+
+        Parameters
+        ----------
+        config : dict
+            A configuration that corresponds to the search space.
+
+        Returns
+        -------
+        dict
+            A dictionary mapping names to values.
+        """
+        values = {}
+        for name, keys, conditional in self._accessors:
+            current = config
+            try:
+                for key in keys:
+                    current = current[key]
+            except (KeyError, IndexError, TypeError):
+                if conditional:
+                    continue
+                raise
+            if current is None and conditional:
+                continue
+            values[name] = current
+        return values
+
+    def get_values_batch(self, configs):
+        """
+        Get the values of all parameters from many configurations at once.
+
+        Parameters
+        ----------
+        configs : list[dict]
+            Configurations that correspond to the search space.
+
+        Returns
+        -------
+        ConfigBatch
+            The values column by column, inactive values are masked.
+        """
+        rows = [self.get_values(config) for config in configs]
+        columns = {}
+        for name, _, conditional in self._accessors:
+            column = [row.get(name) for row in rows]
+            if conditional:
+                active = np.array([v is not None for v in column], dtype=bool)
+                fill = next((v for v in column if v is not None), 0)
+                column = _to_column([fill if v is None else v
+                                     for v in column])
+                columns[name] = np.ma.masked_array(column, mask=~active)
+            else:
+                columns[name] = _to_column(column)
+        return ConfigBatch(columns, len(rows))
 
     def to_json(self):
         son = dict(self.search_space)
         son['_class'] = 'SearchSpace'
+        son['hash'] = self.hash
         if self._id is not None:
             son['_id'] = self._id
         return son
@@ -86,9 +248,10 @@ class SearchSpace(object):
                     valid = False
         return valid
 
-    def sample(self, max_iters_till_cycle=50, strategy="random"):
+    def sample(self, max_iters_till_cycle=50, strategy="random", rng=None):
         if strategy not in ["random", "default"]:
             raise ParamValueExcept("Unknown sampling strategy {}".format(strategy))
+        rng = get_rng(rng)
         # allocate result dict
         res = {}
         # first add all fixed parameters
@@ -98,7 +261,7 @@ class SearchSpace(object):
         considered_params = set()
         for pname in self.non_conditions:
             if strategy == "random":
-                res[pname] = self.parameters[pname].sample()
+                res[pname] = self.parameters[pname].sample(rng)
             else:
                 res[pname] = self.parameters[pname].default()
             considered_params.add(pname)
@@ -112,7 +275,8 @@ class SearchSpace(object):
                     conditioned_on = self.uids_to_names[cparam["condition"]["uid"]]
                     if conditioned_on in res.keys():
                         if strategy == "random":
-                            cres = self.parameters[pname].sample(res[conditioned_on])
+                            cres = self.parameters[pname].sample(
+                                res[conditioned_on], rng)
                         else:
                             cres = self.parameters[pname].default(res[conditioned_on])
                         if cres:
@@ -131,6 +295,50 @@ class SearchSpace(object):
                 raise InconsistentSpace(err.format(remaining_params))
         return res
 
+    def sample_batch(self, n, max_iters_till_cycle=50, rng=None):
+        """
+        Sample n configurations at once.
+
+        Every parameter is sampled with a single vectorized call and the
+        conditions are applied as masks on the sampled columns.
+
+        Parameters
+        ----------
+        n : int
+            The number of configurations.
+        rng : numpy.random.Generator, optional
+            The random number generator to sample from.
+
+        Returns
+        -------
+        ConfigBatch
+            The sampled configurations.
+        """
+        rng = get_rng(rng)
+        columns = {}
+        for pname in self.non_conditions:
+            columns[pname] = self.parameters[pname].sample_batch(n, rng)
+        # then the conditional parameters
+        remaining_params = set(self.conditions)
+        i = 0
+        while remaining_params:
+            for pname in self.conditions:
+                if pname in remaining_params:
+                    cparam = self.parameters[pname]
+                    conditioned_on = self.uids_to_names[
+                        cparam["condition"]["uid"]]
+                    if conditioned_on in columns:
+                        columns[pname] = cparam.sample_batch(
+                            columns[conditioned_on], rng)
+                        remaining_params.remove(pname)
+            i += 1
+            if i > max_iters_till_cycle:
+                err = "Cannot satisfy conditionals involving " \
+                      "parameters {} probably a loop! If you are sure " \
+                      "no loop exists increase max_iters_till_cycle"
+                raise InconsistentSpace(err.format(remaining_params))
+        return ConfigBatch(columns, n)
+
     def default(self, max_iters_till_cycle=50):
         return self.sample(max_iters_till_cycle, strategy="default")
 
@@ -141,6 +349,39 @@ class SearchSpace(object):
             return self.search_space == other.search_space
 
 
+def _to_column(values):
+    # like the columns of SearchSpace.sample_batch, values of mixed types
+    # are kept in an object array instead of being converted to strings
+    if len(set(type(v) for v in values)) > 1:
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+        return column
+    return np.array(values)
+
+
+def _collect_slots(search_space, keys, slots, tuple_paths):
+    """
+    Copy a search space, replacing all parameters by None.
+
+    The path to each parameter is appended to slots together with its uid,
+    the paths of all tuples to tuple_paths, the tuples themselves are
+    replaced by lists such that they can be filled.
+    """
+    if isinstance(search_space, dict):
+        if '_class' in search_space and 'uid' in search_space:
+            slots.append((keys, search_space['uid']))
+            return None
+        return {k: _collect_slots(v, keys + (k,), slots, tuple_paths)
+                for k, v in search_space.items()}
+    elif isinstance(search_space, (list, tuple)):
+        if isinstance(search_space, tuple):
+            tuple_paths.append(keys)
+        return [_collect_slots(v, keys + (i,), slots, tuple_paths)
+                for i, v in enumerate(search_space)]
+    else:
+        return search_space
+
+
 # decorator
 def build_search_space(function):
     # abuse configscope to parse search space definitions
@@ -152,6 +393,53 @@ def build_search_space(function):
     return space
 
 
+def _collect_uids(search_space):
+    if isinstance(search_space, dict):
+        for k, v in search_space.items():
+            if k == 'uid':
+                yield v
+            else:
+                for uid in _collect_uids(v):
+                    yield uid
+    elif isinstance(search_space, (tuple, list)):
+        for v in search_space:
+            for uid in _collect_uids(v):
+                yield uid
+
+
+def _replace_uids(search_space, new_uids):
+    if isinstance(search_space, dict):
+        return {k: new_uids[v] if k == 'uid' else _replace_uids(v, new_uids)
+                for k, v in search_space.items()}
+    elif isinstance(search_space, (tuple, list)):
+        return [_replace_uids(v, new_uids) for v in search_space]
+    else:
+        return search_space
+
+
+def canonicalize_uids(search_space):
+    """
+    Replace the uids in a search space definition by their rank.
+
+    The uids are drawn from a global counter, so defining the same search
+    space twice (or in another process) yields different uids. Their order
+    however only depends on the order of definition, which makes the
+    result comparable across definitions.
+
+    Parameters
+    ----------
+    search_space : dict
+        A JSON-like structure that describes the search space.
+
+    Returns
+    -------
+    dict
+        A copy of the search space with canonical uids.
+    """
+    uids = sorted(set(_collect_uids(search_space)))
+    return _replace_uids(search_space, {uid: i for i, uid in enumerate(uids)})
+
+
 def set_name(hparam, name):
     if ('name' not in hparam or
             len(hparam['name']) > len(name) or
@@ -263,15 +551,44 @@ def get_by_path(config, path):
 
     """
     current = config
-    for p in filter(None, re.split('[.\[\]]', path)):
-        try:
-            p = int(p)
-        except ValueError:
-            pass
+    for p in compile_path(path):
         current = current[p]
     return current
 
 
+_compiled_paths = {}
+
+
+def compile_path(path):
+    """
+    Split a dotted and indexed name into the keys of the path.
+
+    The result is cached, such that every name is only parsed once.
+
+    Parameters
+    ----------
+    path : str
+        A name like 'a.b[0].c'.
+
+    Returns
+    -------
+    tuple
+        The keys along the path, with indices converted to int.
+    """
+    keys = _compiled_paths.get(path)
+    if keys is None:
+        keys = []
+        for p in filter(None, re.split(r'[.\[\]]', path)):
+            try:
+                p = int(p)
+            except ValueError:
+                pass
+            keys.append(p)
+        keys = tuple(keys)
+        _compiled_paths[path] = keys
+    return keys
+
+
 def get_values_from_config(config, hyperparams):
     """
     Infer the values of hyperparameters from a given configuration.
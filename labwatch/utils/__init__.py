@@ -1,2 +1,3 @@
 from .fixed_dict import FixedDict
 from .hashing import hash_dict
+from .observations import ObservationBuffer
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# coding=utf-8
+from __future__ import division, print_function, unicode_literals
+
+import io
+import zipfile
+
+import bson
+from bson.errors import InvalidBSON
+import numpy as np
+
+# key of the BSON encoded structure in the npz archive
+_STRUCTURE = '__structure__'
+_ARRAY = '__array__'
+
+
+def _split(value, arrays):
+    # replace all arrays by references to entries of the npz archive
+    if isinstance(value, np.ndarray):
+        name = 'a{}'.format(len(arrays))
+        arrays[name] = value
+        return {_ARRAY: name}
+    elif isinstance(value, dict):
+        return {k: _split(v, arrays) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [_split(v, arrays) for v in value]
+    elif isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _join(value, archive):
+    if isinstance(value, dict):
+        if set(value) == {_ARRAY}:
+            return archive[value[_ARRAY]]
+        return {k: _join(v, archive) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [_join(v, archive) for v in value]
+    return value
+
+
+def dump_state(state):
+    """
+    Serializes the state of an optimizer into a npz archive.
+
+    Unlike a pickle, loading the archive can not execute code, such that
+    checkpoints can be shared through the database. Arrays are stored as
+    arrays and everything else as BSON, so the state may only contain
+    dicts with string keys, lists, numbers, strings, None and arrays.
+
+    Parameters
+    ----------
+    state: dict
+
+    Returns
+    -------
+    bytes
+    """
+    arrays = dict()
+    structure = bson.BSON.encode(_split(state, arrays))
+    arrays[_STRUCTURE] = np.frombuffer(structure, dtype=np.uint8)
+    f = io.BytesIO()
+    np.savez(f, **arrays)
+    return f.getvalue()
+
+
+def load_state(data):
+    """
+    Restores a state that was serialized with dump_state().
+
+    Raises
+    ------
+    ValueError
+        If the data is no such archive.
+    """
+    try:
+        with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+            archive = {name: archive[name] for name in archive.files}
+        structure = bson.BSON(archive.pop(_STRUCTURE).tobytes()).decode()
+        return _join(structure, archive)
+    except (IOError, OSError, EOFError, zipfile.BadZipFile, InvalidBSON,
+            KeyError, RuntimeError) as e:
+        # zipfile raises RuntimeError or NotImplementedError if the flags
+        # of an entry are broken
+        raise ValueError("Not a checkpoint: {!r}".format(e))
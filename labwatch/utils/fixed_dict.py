@@ -11,6 +11,13 @@ def warn_not_allowed(self, key):
     print(warning.format(key, fullname(self)))
 
 
+def _restore_fixed_dict(cls, items, state):
+    obj = dict.__new__(cls)
+    dict.update(obj, items)
+    obj.__dict__.update(state)
+    return obj
+
+
 class FixedDict(dict):
     def __init__(self, fixed=None):
         if fixed is None:
@@ -33,3 +40,8 @@ class FixedDict(dict):
     def __delitem__(self, key):
         if key not in self.fixed:
             dict.__delitem__(self, key)
+
+    def __reduce__(self):
+        # the default dict pickling would go through __setitem__ before
+        # self.fixed exists, so restore items and attributes directly
+        return _restore_fixed_dict, (type(self), dict(self), self.__dict__)
@@ -1,5 +1,11 @@
+import hashlib
 import json
 
+
 def hash_dict(storage):
-    return hash(json.dumps(storage, sort_keys=True))
-    
+    """
+    Compute a hash of a JSON-like dict that is stable across processes,
+    in contrast to the builtin hash() which is salted for strings.
+    """
+    dump = json.dumps(storage, sort_keys=True)
+    return hashlib.sha1(dump.encode('utf-8')).hexdigest()
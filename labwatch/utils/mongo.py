@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# coding=utf-8
+from __future__ import division, print_function, unicode_literals
+
+import os
+import threading
+
+import gridfs
+import pymongo
+
+_lock = threading.Lock()
+_clients = dict()
+_gridfs = dict()
+# url and options of every client created by get_client, by the id of the
+# client, such that a forked child can connect to the same server again
+_client_specs = dict()
+
+
+def _forget_all():
+    # connections must not be shared with a forked child, handles that
+    # were created before the fork have to be replaced with reconnect()
+    _clients.clear()
+    _gridfs.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_all)
+
+
+def get_client(url='localhost', **options):
+    """
+    Returns the MongoClient of this process for the url and options.
+
+    All LabAssistants of a process share one client, and thereby one
+    connection pool, per url and options. A forked child gets new clients
+    from get_client(), but handles it inherited from its parent still use
+    the parent's client and have to be replaced with reconnect().
+
+    Parameters
+    ----------
+    url: str
+        Host name or MongoDB URI.
+    options:
+        Keyword arguments for pymongo.MongoClient, e.g. maxPoolSize,
+        serverSelectionTimeoutMS, socketTimeoutMS or w.
+
+    Returns
+    -------
+    pymongo.MongoClient
+    """
+    key = (os.getpid(), url, tuple(sorted(options.items())))
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = pymongo.MongoClient(url, **options)
+            _clients[key] = client
+            _client_specs[id(client)] = (client, url, options)
+    return client
+
+
+def _client_spec(client):
+    spec = _client_specs.get(id(client))
+    if spec is not None and spec[0] is client:
+        return spec[1], dict(spec[2])
+    # clients that were created elsewhere, e.g. by sacred
+    kwargs = getattr(client, '_MongoClient__init_kwargs', None)
+    if kwargs is None:
+        kwargs = getattr(client, '_init_kwargs', None)
+    if kwargs is None:
+        return None
+    kwargs = dict(kwargs)
+    url = kwargs.pop('host', None)
+    if isinstance(url, list):
+        url = tuple(url)
+    return url, kwargs
+
+
+def reconnect(collection):
+    """
+    Returns the collection on the client of this process that connects to
+    the same server with the same options.
+
+    A forked child must not use the clients of its parent, all handles it
+    inherited have to be replaced with the result of this function.
+    Collections of clients that are no pymongo.MongoClient, e.g. of
+    mongomock, are returned as they are.
+
+    Parameters
+    ----------
+    collection: pymongo.collection.Collection
+
+    Returns
+    -------
+    pymongo.collection.Collection
+    """
+    client = collection.database.client
+    if not isinstance(client, pymongo.MongoClient):
+        return collection
+    spec = _client_spec(client)
+    if spec is None:
+        return collection
+    url, options = spec
+    try:
+        new_client = get_client(url, **options)
+    except TypeError:
+        # options that can not be hashed, do not share the client
+        new_client = pymongo.MongoClient(url, **options)
+    if new_client is client:
+        return collection
+    return new_client[collection.database.name][collection.name]
+
+
+def reconnect_gridfs(fs):
+    """Like reconnect() but for a GridFS handle."""
+    # GridFS does not expose the collection it was created for
+    collection = getattr(fs, '_GridFS__collection', None)
+    if collection is None:
+        return fs
+    new_collection = reconnect(collection)
+    if new_collection is collection:
+        return fs
+    return get_gridfs(new_collection.database, collection=collection.name)
+
+
+def get_gridfs(database, collection='fs'):
+    """Returns a shared GridFS handle for the database and collection."""
+    key = (os.getpid(), id(database.client), database.name, collection)
+    with _lock:
+        entry = _gridfs.get(key)
+        if entry is None:
+            # keep the database alive such that its id is not reused
+            entry = (database, gridfs.GridFS(database, collection=collection))
+            _gridfs[key] = entry
+    return entry[1]
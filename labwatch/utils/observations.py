@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# coding=utf-8
+from __future__ import division, print_function, unicode_literals
+
+import numpy as np
+
+
+def _row_keys(X):
+    """Turn every row of X into a bytes object that can be hashed."""
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    rows = X.view(np.dtype((np.void, X.dtype.itemsize * X.shape[1])))
+    return rows.ravel().tolist()
+
+
+class ObservationBuffer(object):
+    """
+    Growable storage for encoded configurations and their costs.
+
+    The arrays are preallocated and doubled in size whenever they are full,
+    such that adding n observations takes amortized O(n) time. Exact
+    duplicates of an already stored configuration vector are ignored, they
+    are detected via a hash index on the raw bytes of the vector.
+    """
+
+    def __init__(self, capacity=16):
+        self.capacity = capacity
+        self.n = 0
+        self._X = None
+        self._y = None
+        self._index = dict()
+
+    def __len__(self):
+        return self.n
+
+    def __contains__(self, x):
+        return _row_keys(np.atleast_2d(x))[0] in self._index
+
+    @property
+    def X(self):
+        """The stored configurations or None if there are none yet."""
+        if self.n == 0:
+            return None
+        return self._X[:self.n]
+
+    @property
+    def y(self):
+        """The stored costs or None if there are none yet."""
+        if self.n == 0:
+            return None
+        return self._y[:self.n]
+
+    def _reserve(self, n_dims, n_new):
+        if self._X is None:
+            capacity = max(self.capacity, n_new)
+            self._X = np.empty([capacity, n_dims])
+            self._y = np.empty([capacity])
+        elif self.n + n_new > self._X.shape[0]:
+            capacity = max(2 * self._X.shape[0], self.n + n_new)
+            X = np.empty([capacity, n_dims])
+            y = np.empty([capacity])
+            X[:self.n] = self._X[:self.n]
+            y[:self.n] = self._y[:self.n]
+            self._X, self._y = X, y
+
+    def add(self, x, y):
+        """
+        Add a single observation.
+
+        Returns
+        -------
+        bool:
+            True if the observation was added, False if it was a duplicate.
+        """
+        return self.extend(np.atleast_2d(x), [y]) == 1
+
+    def extend(self, X, y):
+        """
+        Add many observations at once.
+
+        Parameters
+        ----------
+        X: np.ndarray
+            Array of shape (n, d) with the encoded configurations.
+        y: np.ndarray
+            Array of shape (n,) with the corresponding costs.
+
+        Returns
+        -------
+        int:
+            The number of observations that were actually added.
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        y = np.asarray(y, dtype=np.float64).ravel()
+        if X.shape[0] == 0:
+            return 0
+        if X.shape[0] != y.shape[0]:
+            raise ValueError("Got {} configurations but {} costs".format(
+                X.shape[0], y.shape[0]))
+        if self._X is not None and X.shape[1] != self._X.shape[1]:
+            raise ValueError("Expected configurations with {} dimensions "
+                             "but got {}".format(self._X.shape[1], X.shape[1]))
+
+        # filter duplicates of stored observations and within X itself
+        keep = []
+        for i, key in enumerate(_row_keys(X)):
+            if key not in self._index:
+                self._index[key] = self.n + len(keep)
+                keep.append(i)
+        if len(keep) < X.shape[0]:
+            X, y = X[keep], y[keep]
+
+        self._reserve(X.shape[1], X.shape[0])
+        self._X[self.n:self.n + X.shape[0]] = X
+        self._y[self.n:self.n + X.shape[0]] = y
+        self.n += X.shape[0]
+        return X.shape[0]
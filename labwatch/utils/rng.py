@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# coding=utf-8
+from __future__ import division, print_function, unicode_literals
+
+import numpy as np
+
+# used whenever no explicit random number generator is given
+_default_rng = None
+
+
+def get_rng(rng=None):
+    """
+    Turn the given seed into a numpy random number generator.
+
+    Parameters
+    ----------
+    rng: None, int, numpy.random.SeedSequence or numpy.random.Generator
+        A Generator is returned as it is such that it can be threaded
+        through all calls. For None a process wide generator seeded from
+        the operating system is returned.
+
+    Returns
+    -------
+    numpy.random.Generator
+    """
+    global _default_rng
+    if isinstance(rng, np.random.Generator):
+        return rng
+    if rng is None:
+        if _default_rng is None:
+            _default_rng = np.random.default_rng()
+        return _default_rng
+    return np.random.default_rng(rng)
+
+
+def spawn_rngs(rng, n):
+    """
+    Create n independent child generators, e.g. one for each worker.
+
+    The children only depend on the seed of rng and on how many children
+    were spawned from it before, so they are reproducible.
+
+    Parameters
+    ----------
+    rng: None, int, numpy.random.SeedSequence or numpy.random.Generator
+        The parent generator or its seed.
+    n: int
+        The number of generators to create.
+
+    Returns
+    -------
+    list[numpy.random.Generator]
+    """
+    bit_generator = get_rng(rng).bit_generator
+    seed_seq = getattr(bit_generator, 'seed_seq', None)
+    if seed_seq is None:
+        seed_seq = bit_generator._seed_seq
+    return [np.random.default_rng(s) for s in seed_seq.spawn(n)]
+
+
+def get_seed(rng):
+    """Draw an integer seed for libraries that do not accept a Generator."""
+    return int(get_rng(rng).integers(2 ** 31 - 1))
+
+
+def get_random_state(rng):
+    """Create a legacy numpy RandomState seeded from the given generator."""
+    return np.random.RandomState(get_seed(rng))
@@ -2,7 +2,21 @@
 # coding=utf-8
 from __future__ import division, print_function, unicode_literals
 
-from pkg_resources import parse_version
+from packaging.version import InvalidVersion, Version
+
+
+def parse_version(version):
+    """
+    Turns a version string into a key that orders versions like PEP 440.
+
+    Versions that do not follow PEP 440 are ordered before all others and
+    among each other by their string, like the legacy versions of
+    setuptools. Local version labels are ignored.
+    """
+    try:
+        return 0, Version(Version(version.strip()).public)
+    except InvalidVersion:
+        return -1, version
 
 
 def parse_name_ver(name_version):
@@ -11,6 +25,8 @@ def parse_name_ver(name_version):
 
 
 def check_dependencies(ex_dep, run_dep, version_policy):
+    ex_versions = dict(name_version.partition('==')[::2]
+                       for name_version in ex_dep)
     ex_dep = dict([parse_name_ver(name_version) for name_version in ex_dep])
     check_version = {
         'newer': lambda ex, name, b: name in ex and ex[name] >= b,
@@ -19,8 +35,9 @@ def check_dependencies(ex_dep, run_dep, version_policy):
     }[version_policy]
     for name_version in run_dep:
         name, ver = parse_name_ver(name_version)
-        assert check_version(ex_dep, name, parse_version(ver)), \
-            "{} mismatch: ex={}, run={}".format(name, ex_dep[name], ver)
+        assert check_version(ex_dep, name, ver), \
+            "{} mismatch: ex={}, run={}".format(
+                name, ex_versions.get(name), name_version.partition('==')[2])
 
 
 def check_sources(ex_sources, run_sources):
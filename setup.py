@@ -12,7 +12,8 @@ License :: OSI Approved :: MIT License
 """
 
 requires = [
-    'numpy >= 1.7',
+    'numpy >= 1.17',
+    'packaging',
     'sacred',
     'pymongo',
     'ConfigSpace'
@@ -38,5 +39,7 @@ setup(name='labwatch',
       packages=['labwatch', 'labwatch.utils', 'labwatch.optimizers', 'labwatch.converters'],
       include_package_data=True,
       tests_require=['mock', 'mongomock', 'pytest'],
+      # the optimizers are resolved lazily through a module __getattr__
+      python_requires='>=3.7',
       install_requires=requires
 )
@@ -0,0 +1,808 @@
+#!/usr/bin/env python
+# coding=utf-8
+from __future__ import division, print_function, unicode_literals
+
+import collections
+import datetime
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+import pytest
+mongomock = pytest.importorskip('mongomock')
+import mongomock.gridfs
+
+from sacred import Experiment
+from sacred.observers import MongoObserver
+
+import labwatch.assistant
+from labwatch.assistant import LabAssistant, parse_optimizer_spec
+from labwatch.optimizers.random_search import RandomSearch
+from labwatch.hyperparameters import UniformFloat, Categorical
+from labwatch.optimizers.base import Optimizer
+from labwatch.searchspace import build_search_space
+from labwatch.utils.checkpoint import load_state
+from labwatch.utils.mongo import get_gridfs
+
+# sacred < 0.8 can not create runs on python >= 3.10, it uses the aliases
+# that were removed from collections
+creates_runs = pytest.mark.skipif(not hasattr(collections, 'Mapping'),
+                                  reason="sacred can not create runs")
+
+
+def small_space():
+    batch_size = Categorical([32, 64])
+    learning_rate = UniformFloat(1e-4, 1e-1, log_scale=True)
+
+
+def float_space():
+    x = UniformFloat(0, 1)
+
+
+@pytest.fixture
+def assistant():
+    db = mongomock.MongoClient().db
+    ex = Experiment('test')
+    ex.observers.append(MongoObserver(db.runs, None))
+    a = LabAssistant(ex)
+    a._init_db()
+    return a
+
+
+def test_search_space_is_stored_once(assistant):
+    first = assistant._verify_and_init_search_space(
+        build_search_space(small_space))
+    # a fresh assistant does not know the search space yet
+    assistant.search_spaces.clear()
+    second = assistant._verify_and_init_search_space(
+        build_search_space(small_space))
+    assert assistant.db_search_space.count_documents({}) == 1
+    assert first.hash == second.hash
+    assert first._id == second._id
+
+
+def test_search_space_without_hash_is_found(assistant):
+    son = build_search_space(small_space).to_json()
+    del son['hash']
+    assistant.db_search_space.insert_one(son)
+    sp = assistant._verify_and_init_search_space(
+        build_search_space(small_space))
+    assert sp._id == son['_id']
+    assert assistant.db_search_space.count_documents({}) == 1
+    assert assistant.db_search_space.find_one()['hash'] == sp.hash
+
+
+def test_optimizer_is_reused_and_resumed(assistant, tmpdir):
+    assistant.snapshot_dir = str(tmpdir)
+    assistant.current_search_space = assistant._verify_and_init_search_space(
+        build_search_space(small_space))
+    optimizer = assistant._init_optimizer()
+    assert assistant._init_optimizer() is optimizer
+
+    assistant.optimizer_state.watermark = 3
+    assistant._save_checkpoint()
+    # a restarted assistant resumes from the snapshot
+    assistant.optimizers.clear()
+    assistant._init_optimizer()
+    assert assistant.optimizer_state.watermark == 3
+
+
+def test_mongo_db_option_uses_shared_client(assistant):
+    from labwatch.utils.mongo import get_client
+    assistant._option_hook({"--mongo_db": "localhost:27017:labwatch.runs"})
+    runs = assistant.mongo_observer.runs
+    assert runs.full_name == "labwatch.runs"
+    assert runs.database.client is get_client("localhost:27017")
+
+
+class RecordingOptimizer(RandomSearch):
+    """Remembers the ids of all runs it was updated with."""
+
+    def __init__(self, config_space, rng=None):
+        super(RecordingOptimizer, self).__init__(config_space, rng)
+        self.updates = []
+
+    def update(self, configs, costs, runs):
+        self.updates.extend(run['_id'] for run in runs)
+
+
+class CountingCollection(object):
+    """Counts the completed runs a collection returned."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.returned = 0
+        self.after_find_one = None
+
+    def find(self, query, *args, **kwargs):
+        docs = list(self.collection.find(query, *args, **kwargs))
+        if query.get('status') == 'COMPLETED':
+            self.returned += len(docs)
+        return docs
+
+    def find_one(self, *args, **kwargs):
+        doc = self.collection.find_one(*args, **kwargs)
+        if self.after_find_one is not None:
+            self.after_find_one()
+        return doc
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+def add_run(assistant, _id, status, **fields):
+    run = {'_id': _id, 'status': status,
+           'config': {'batch_size': 32, 'learning_rate': 0.001 * _id},
+           'meta': {'options': {'UPDATE': ['small_space']}}}
+    if status == 'COMPLETED':
+        run['result'] = float(_id)
+    run.update(fields)
+    assistant.runs.insert_one(run)
+
+
+def set_status(assistant, _id, status):
+    assistant.runs.update_one({'_id': _id}, {'$set': {
+        'status': status, 'result': float(_id)}})
+
+
+@pytest.fixture
+def recording(assistant):
+    assistant.optimizer_class = RecordingOptimizer
+    assistant.current_search_space_name = 'small_space'
+    assistant.current_search_space = assistant._verify_and_init_search_space(
+        build_search_space(small_space))
+    assistant.runs = CountingCollection(assistant.runs)
+    return assistant
+
+
+def test_update_optimizer_advances_watermark(recording):
+    optimizer = recording._init_optimizer()
+    add_run(recording, 1, 'COMPLETED')
+    add_run(recording, 2, 'COMPLETED')
+    recording.update_optimizer()
+    assert optimizer.updates == [1, 2]
+    assert recording.optimizer_state.watermark == 2
+    assert recording.optimizer_state.known_jobs == set()
+
+    add_run(recording, 3, 'COMPLETED')
+    recording.update_optimizer()
+    assert optimizer.updates == [1, 2, 3]
+    assert recording.optimizer_state.watermark == 3
+    assert recording.runs.returned == 3
+
+
+def test_update_optimizer_with_pinned_active_run(recording):
+    optimizer = recording._init_optimizer()
+    # an old queued run with a low priority pins the watermark
+    add_run(recording, 1, 'QUEUED', priority=-1)
+    add_run(recording, 2, 'COMPLETED')
+    add_run(recording, 3, 'COMPLETED')
+    recording.update_optimizer()
+    assert optimizer.updates == [2, 3]
+    assert recording.optimizer_state.watermark is None
+    assert recording.optimizer_state.known_jobs == {2, 3}
+
+    # the known runs are not transferred again
+    recording.update_optimizer()
+    assert recording.runs.returned == 2
+    assert optimizer.updates == [2, 3]
+
+    set_status(recording, 1, 'COMPLETED')
+    recording.update_optimizer()
+    assert optimizer.updates == [2, 3, 1]
+    assert recording.optimizer_state.watermark == 3
+    assert recording.optimizer_state.known_jobs == set()
+    assert recording.runs.returned == 3
+
+
+def test_update_optimizer_bounds_excluded_runs(recording, monkeypatch):
+    monkeypatch.setattr(labwatch.assistant, 'MAX_EXCLUDED_RUNS', 1)
+    optimizer = recording._init_optimizer()
+    # a killed run stays RUNNING until it is reaped
+    add_run(recording, 1, 'RUNNING')
+    for i in range(2, 5):
+        add_run(recording, i, 'COMPLETED')
+    recording.update_optimizer()
+    add_run(recording, 5, 'COMPLETED')
+    queries = []
+    find = recording.runs.find
+
+    def recording_find(query, *args, **kwargs):
+        queries.append(query)
+        return find(query, *args, **kwargs)
+    monkeypatch.setattr(recording.runs, 'find', recording_find)
+    recording.update_optimizer()
+    assert optimizer.updates == [2, 3, 4, 5]
+    assert recording.optimizer_state.known_jobs == {2, 3, 4, 5}
+    # the known runs are filtered on the client
+    assert '$nin' not in queries[0].get('_id', {})
+
+
+def test_update_optimizer_run_completes_between_queries(recording):
+    optimizer = recording._init_optimizer()
+    add_run(recording, 1, 'RUNNING', heartbeat=datetime.datetime.utcnow())
+    add_run(recording, 2, 'COMPLETED')
+    # run 1 completes after the oldest active run was looked up
+    recording.runs.after_find_one = lambda: set_status(recording, 1,
+                                                       'COMPLETED')
+    recording.update_optimizer()
+    recording.runs.after_find_one = None
+    assert optimizer.updates == [1, 2]
+    assert recording.optimizer_state.watermark is None
+
+    recording.update_optimizer()
+    assert optimizer.updates == [1, 2]
+    assert recording.optimizer_state.watermark == 2
+    assert recording.optimizer_state.known_jobs == set()
+
+
+class CountingInserts(object):
+    """Counts insert_many calls, the first find_one sees an old last id."""
+
+    def __init__(self, collection, stale_id=None):
+        self.collection = collection
+        self.inserts = 0
+        self.stale_id = stale_id
+
+    def insert_many(self, *args, **kwargs):
+        self.inserts += 1
+        return self.collection.insert_many(*args, **kwargs)
+
+    def find_one(self, *args, **kwargs):
+        if self.stale_id is not None:
+            stale, self.stale_id = self.stale_id, None
+            return {'_id': stale}
+        return self.collection.find_one(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+def test_insert_runs_uses_contiguous_ids(assistant):
+    assistant.runs = CountingInserts(assistant.runs)
+    assert assistant._insert_runs([{'x': i} for i in range(3)]) == [1, 2, 3]
+    assert assistant.runs.inserts == 1
+    assert assistant._insert_runs([{'x': i} for i in range(2)]) == [4, 5]
+    assert assistant.runs.inserts == 2
+
+
+def test_insert_runs_retries_taken_ids(assistant):
+    assistant._insert_runs([{'x': i} for i in range(3)])
+    # another process inserted runs 2 and 3 in the meantime
+    assistant.runs = CountingInserts(assistant.runs, stale_id=1)
+    assert assistant._insert_runs([{'x': i} for i in range(2)]) == [4, 5]
+    assert assistant.runs.count_documents({}) == 5
+
+
+class PendingCountingOptimizer(Optimizer):
+    """Suggests the number of pending configurations."""
+
+    def suggest_configuration(self):
+        return {'batch_size': 32, 'learning_rate': 1e-3 * len(self.pending)}
+
+
+def test_suggest_configurations_marks_batch_pending():
+    space = build_search_space(small_space)
+    optimizer = PendingCountingOptimizer(space)
+    optimizer.set_pending([{'batch_size': 64, 'learning_rate': 0.01}])
+    suggestions = optimizer.suggest_configurations(3)
+    # every suggestion saw the previous ones as pending (constant liar)
+    assert [s['learning_rate'] for s in suggestions] == [1e-3, 2e-3, 3e-3]
+    assert optimizer.pending == [{'batch_size': 64, 'learning_rate': 0.01}]
+
+
+def test_get_suggestions_updates_once(recording, monkeypatch):
+    recording.optimizer_class = PendingCountingOptimizer
+    recording._init_optimizer()
+    updates = []
+    original = recording.update_optimizer
+    monkeypatch.setattr(recording, 'update_optimizer',
+                        lambda: updates.append(original()))
+    suggestions = recording.get_suggestions(3)
+    assert len(updates) == 1
+    uids = {param['uid']: name for name, param in
+            recording.current_search_space.parameters.items()}
+    assert [{uids[k]: v for k, v in s.items()}['learning_rate']
+            for s in suggestions] == [0., 1e-3, 2e-3]
+
+
+queue_ex = Experiment('queue_test')
+
+
+@queue_ex.config
+def queue_cfg():
+    batch_size = 32
+    learning_rate = 0.01
+
+
+@queue_ex.main
+def train(batch_size, learning_rate):
+    return learning_rate
+
+
+@creates_runs
+def test_enqueue_suggestions_inserts_batch():
+    mongomock.gridfs.enable_gridfs_integration()
+    db = mongomock.MongoClient().db
+    ex = queue_ex
+    ex.observers[:] = [MongoObserver(db.runs, get_gridfs(db))]
+    assistant = LabAssistant(ex)
+    assistant._init_db()
+    assistant.current_search_space_name = 'small_space'
+    assistant.current_search_space = assistant._verify_and_init_search_space(
+        build_search_space(small_space))
+    assistant._init_optimizer()
+    assistant.runs = CountingInserts(assistant.runs)
+
+    ids = assistant.enqueue_suggestions(3, priority=2)
+    assert ids == [1, 2, 3]
+    assert assistant.runs.inserts == 1
+    assert assistant.enqueue_suggestion() == 4
+    for run in db.runs.find():
+        assert run['status'] == 'QUEUED'
+        # the command defaults to the main function of the experiment
+        assert run['command'] == 'train'
+        assert run['meta']['options']['UPDATE'] == ['small_space']
+        assert run['priority'] == (2 if run['_id'] < 4 else 0)
+        assert run['config']['batch_size'] in [32, 64]
+
+
+def test_pending_configs_skip_dead_runs(recording):
+    now = datetime.datetime.utcnow()
+    old = now - datetime.timedelta(seconds=recording.heartbeat_timeout + 1)
+    later = now + datetime.timedelta(seconds=60)
+    add_run(recording, 1, 'QUEUED')
+    add_run(recording, 2, 'INITIALIZING', claim={'lease_expires': later})
+    add_run(recording, 3, 'INITIALIZING', claim={'lease_expires': old})
+    add_run(recording, 4, 'RUNNING', heartbeat=now)
+    add_run(recording, 5, 'RUNNING', heartbeat=old)
+    add_run(recording, 6, 'RUNNING', heartbeat=None, start_time=now)
+    add_run(recording, 7, 'RUNNING', heartbeat=None, start_time=old)
+    add_run(recording, 8, 'COMPLETED')
+    pending = recording._get_pending_configs(
+        {'meta.options.UPDATE': 'small_space'})
+    assert sorted(round(c['learning_rate'] * 1000) for c in pending) == \
+        [1, 2, 4, 6]
+
+
+def test_parse_optimizer_spec():
+    assert parse_optimizer_spec("TPE") == ("TPE", {})
+    assert parse_optimizer_spec("BayesianOptimization burnin=50 "
+                                "kernel=matern rates=[1,2]") == \
+        ("BayesianOptimization",
+         {"burnin": 50, "kernel": "matern", "rates": [1, 2]})
+    with pytest.raises(ValueError):
+        parse_optimizer_spec("TPE burnin")
+
+
+def test_optimizer_by_name(assistant):
+    assistant.optimizer_class = "randomsearch"
+    assistant.current_search_space = assistant._verify_and_init_search_space(
+        build_search_space(small_space))
+    from labwatch.optimizers.random_search import RandomSearch
+    assert isinstance(assistant._init_optimizer(), RandomSearch)
+
+    # the command line option replaces the optimizer
+    assistant._option_hook({"--optimizer": "BayesianOptimization burnin=5"})
+    assert assistant.optimizer_class == "BayesianOptimization"
+    assert assistant.optimizer_kwargs == {"burnin": 5}
+    assert assistant.optimizers == {}
+
+
+def test_optimizer_checkpoint_in_gridfs(assistant):
+    mongomock.gridfs.enable_gridfs_integration()
+    assistant.checkpoint = True
+    assistant.current_search_space = assistant._verify_and_init_search_space(
+        build_search_space(small_space))
+    optimizer = assistant._init_optimizer()
+    for i in range(2):
+        optimizer.observations.add([i, 0.5], float(i))
+        assistant._save_checkpoint(force=True)
+    fs = assistant._get_checkpoint_fs()
+    assert len(list(fs.find({}))) == 1
+
+    assistant.optimizers.clear()
+    restored = assistant._init_optimizer()
+    assert restored is not optimizer
+    assert np.all(restored.X == optimizer.X)
+    assert np.all(restored.y == optimizer.y)
+
+
+def test_checkpoint_writes_are_throttled(assistant, tmpdir):
+    assistant.snapshot_dir = str(tmpdir)
+    assistant.checkpoint_every = 3
+    assistant.current_search_space = assistant._verify_and_init_search_space(
+        build_search_space(small_space))
+    optimizer = assistant._init_optimizer()
+    path = assistant._snapshot_path(assistant.current_search_space.hash)
+
+    def saved_observations():
+        with open(path, 'rb') as f:
+            return load_state(f.read())['n_observations']
+
+    optimizer.observations.add([0, 0.5], 0.)
+    assistant._save_checkpoint()
+    assert saved_observations() == 1
+    for i in range(1, 3):
+        optimizer.observations.add([i, 0.5], float(i))
+        assistant._save_checkpoint()
+    assert saved_observations() == 1
+    optimizer.observations.add([3, 0.5], 3.)
+    assistant._save_checkpoint()
+    assert saved_observations() == 4
+
+    optimizer.observations.add([4, 0.5], 4.)
+    assistant.checkpoint_interval = 0
+    assistant._save_checkpoint()
+    assert saved_observations() == 5
+
+
+def test_broken_checkpoint_is_ignored(assistant, tmpdir):
+    assistant.snapshot_dir = str(tmpdir)
+    assistant.current_search_space = assistant._verify_and_init_search_space(
+        build_search_space(small_space))
+    path = assistant._snapshot_path(assistant.current_search_space.hash)
+    with open(path, 'wb') as f:
+        f.write(pickle.dumps({'watermark': 3}))
+    assistant._init_optimizer()
+    assert assistant.optimizer_state.watermark is None
+
+
+def test_prefetched_suggestions(assistant):
+    assistant.prefetch = 2
+    assistant.prefetch_interval = 0.01
+    assistant.current_search_space_name = 'small_space'
+    assistant.current_search_space = assistant._verify_and_init_search_space(
+        build_search_space(small_space))
+    assistant._init_optimizer()
+    try:
+        values = assistant.get_suggestion()
+        assert set(values) == set(assistant.current_search_space.uids_to_names)
+        for _ in range(100):
+            if len(assistant.prefetcher.buffer) == 2:
+                break
+            time.sleep(0.01)
+        ready = assistant.prefetcher.buffer[0][2]
+        assert assistant.get_suggestion() == \
+            assistant._suggestion_to_values(ready)
+    finally:
+        assistant.stop_prefetch()
+    assert assistant.prefetcher is None
+
+
+def test_prefetcher_drops_outdated_suggestions(assistant):
+    prefetcher = labwatch.assistant.SuggestionPrefetcher(assistant, 2, 1)
+    prefetcher.buffer = [('a', 1, 'old'), ('b', 1, 'other'), ('a', 2, 'new')]
+    assert prefetcher.pop('a', 3) is None
+    assert prefetcher.buffer == [('b', 1, 'other')]
+    prefetcher.buffer.append(('a', 3, 'fresh'))
+    assert prefetcher.pop('a', 3) == 'fresh'
+
+
+def test_search_space_name_changes_with_optimizer(assistant):
+    # the name must not change while the prefetch thread holds the lock
+    names = []
+    verify = assistant._verify_and_init_search_space
+
+    def verify_and_record(sp):
+        names.append(assistant.current_search_space_name)
+        return verify(sp)
+    assistant._verify_and_init_search_space = verify_and_record
+    assistant._lock.acquire()
+    try:
+        thread = threading.Thread(
+            target=assistant._search_space_wrapper,
+            kwargs={'space': small_space, 'space_name': 'small_space'})
+        thread.daemon = True
+        thread.start()
+        thread.join(0.1)
+        assert assistant.current_search_space_name is None
+    finally:
+        assistant._lock.release()
+    thread.join(5)
+    assert names == ['small_space']
+
+
+def test_dequeue_falls_back_to_polling(assistant):
+    start = time.time()
+    assert assistant._dequeue_run(0.1, 0.01) is None
+    # the time limit is the one of the caller
+    assert time.time() - start < 1
+    # mongomock does not support change streams
+    assert not assistant.use_change_streams
+
+
+class FakeStream(object):
+    """Change stream that returns the given events, None means no change."""
+
+    def __init__(self, events, on_event=None):
+        self.events = list(events)
+        self.on_event = on_event
+        self.closed = False
+
+    def try_next(self):
+        event = self.events.pop(0) if self.events else None
+        if isinstance(event, Exception):
+            raise event
+        if event is not None and self.on_event is not None:
+            self.on_event()
+        return event
+
+    def close(self):
+        self.closed = True
+
+
+def count_claims(assistant):
+    claims = []
+    claim_run = assistant._claim_run
+
+    def counting():
+        claims.append(time.time())
+        return claim_run()
+    assistant._claim_run = counting
+    return claims
+
+
+def test_dequeue_only_claims_after_change(assistant):
+    stream = FakeStream([None, None, None, {'operationType': 'insert'}],
+                        on_event=lambda: queue_runs(assistant, 1))
+    assistant._watch_queue = lambda max_await_time: stream
+    claims = count_claims(assistant)
+    run = assistant._dequeue_run(10, 0.01)
+    assert run['config'] == {'x': 0}
+    # once before waiting and once after the change
+    assert len(claims) == 2
+    assert stream.closed
+
+
+def test_dequeue_falls_back_to_polling_if_stream_fails(assistant):
+    from pymongo.errors import OperationFailure
+    stream = FakeStream([OperationFailure('stream died')])
+    assistant._watch_queue = lambda max_await_time: stream
+    claims = count_claims(assistant)
+    assert assistant._dequeue_run(0.1, 0.01) is None
+    assert stream.closed
+    assert len(claims) > 2
+
+
+def test_claim_by_priority_then_fifo(assistant):
+    experiment = {'name': 'test'}
+    assistant.runs.insert_many([
+        {'_id': 1, 'status': 'QUEUED', 'priority': 0,
+         'experiment': experiment},
+        {'_id': 2, 'status': 'QUEUED', 'priority': 1,
+         'experiment': experiment},
+        {'_id': 3, 'status': 'QUEUED', 'priority': 0,
+         'experiment': experiment},
+        {'_id': 4, 'status': 'COMPLETED', 'priority': 5,
+         'experiment': experiment},
+        # runs of other experiments are not claimed
+        {'_id': 5, 'status': 'QUEUED', 'priority': 9,
+         'experiment': {'name': 'other'}}])
+    claimed = [assistant._claim_run()['_id'] for _ in range(3)]
+    assert claimed == [2, 1, 3]
+    assert assistant._claim_run() is None
+    run = assistant.runs.find_one({'_id': 1})
+    assert run['status'] == 'INITIALIZING'
+    assert 'token' in run['claim']
+
+
+def test_run_with_lost_claim_is_not_started(assistant):
+    assistant.runs.insert_many([
+        {'_id': 1, 'status': 'QUEUED', 'experiment': {'name': 'test'}},
+        {'_id': 2, 'status': 'QUEUED', 'experiment': {'name': 'test'}}])
+    lost, kept = assistant._claim_run(), assistant._claim_run()
+    # the claim expired and another worker took the run
+    assistant.runs.update_one({'_id': 1},
+                              {'$set': {'claim.token': 'other'}})
+    assert assistant._run_queued(lost) is None
+    assert assistant.runs.find_one({'_id': 1})['claim']['token'] == 'other'
+
+    # a valid claim is renewed before the run starts
+    lease = kept['claim']['lease_expires']
+    assert assistant._renew_claim(kept)
+    assert assistant.runs.find_one({'_id': 2})['claim']['lease_expires'] >= \
+        lease
+    assistant.runs.update_one({'_id': 2}, {'$set': {'status': 'QUEUED'}})
+    assert not assistant._renew_claim(kept)
+
+
+def test_run_of_other_experiment_is_not_claimed(assistant):
+    assistant.runs.insert_one({'_id': 1, 'status': 'QUEUED',
+                               'experiment': {'name': 'other'}})
+    assert assistant._dequeue_run(0.05, 0.01) is None
+    run = assistant.runs.find_one({'_id': 1})
+    assert run['status'] == 'QUEUED'
+    assert 'claim' not in run
+
+
+def test_claimed_run_is_released_if_it_does_not_fit(assistant):
+    assistant._ex_info = {'name': 'test', 'sources': [['a.py', 'abc']],
+                          'dependencies': []}
+    assistant.runs.insert_one({'_id': 1, 'status': 'QUEUED',
+                               'experiment': {'name': 'test',
+                                              'sources': [['a.py', 'def']],
+                                              'dependencies': []}})
+    with pytest.raises(KeyError):
+        assistant._dequeue_run(0.1, 0.01)
+    run = assistant.runs.find_one({'_id': 1})
+    assert run['status'] == 'QUEUED'
+    assert 'claim' not in run
+
+
+def test_reap_stalled_runs(assistant):
+    now = datetime.datetime.utcnow()
+    long_ago = now - datetime.timedelta(hours=1)
+    assistant.runs.insert_many([
+        {'_id': 1, 'status': 'INITIALIZING',
+         'claim': {'lease_expires': long_ago}},
+        {'_id': 2, 'status': 'RUNNING', 'heartbeat': long_ago,
+         'retries': 3},
+        {'_id': 3, 'status': 'RUNNING', 'heartbeat': now},
+        {'_id': 4, 'status': 'INITIALIZING',
+         'claim': {'lease_expires': now + datetime.timedelta(hours=1)}}])
+    assert assistant.reap_stalled_runs() == ([1], [2])
+    run = assistant.runs.find_one({'_id': 1})
+    assert run['status'] == 'QUEUED'
+    assert run['retries'] == 1
+    assert 'claim' not in run
+    assert assistant.runs.find_one({'_id': 2})['status'] == 'FAILED'
+    assert assistant.reap_stalled_runs() == ([], [])
+    assert 'reap_stalled_runs' in assistant.ex.commands
+
+
+class FinishedRun(object):
+    def __init__(self, _id):
+        self._id = _id
+
+
+def queue_runs(assistant, n):
+    entries = [{'experiment': {'name': 'test', 'sources': [],
+                               'dependencies': []},
+                'command': 'main', 'config': {'x': i}, 'meta': {},
+                'status': 'QUEUED', 'priority': 0} for i in range(n)]
+    assistant._ex_info = {'name': 'test', 'sources': [], 'dependencies': []}
+    return assistant._insert_runs(entries)
+
+
+def test_serve_runs_queued_runs(assistant):
+    ids = queue_runs(assistant, 3)
+    assistant._run_queued = lambda queued: FinishedRun(queued['_id'])
+    assert assistant.serve(max_runs=2, idle_timeout=0.1,
+                           sleep_time=0.01) == ids[:2]
+    assert assistant.runs.count_documents({'status': 'QUEUED'}) == 1
+    assert assistant.serve(idle_timeout=0.1, sleep_time=0.01) == ids[2:]
+
+
+def test_serve_runs_concurrently_in_processes(assistant):
+    queue_runs(assistant, 3)
+    # every worker process has its own copy of the mongomock database,
+    # the runs report the process they were executed in. A run only
+    # finishes once the other worker started one, otherwise the first
+    # worker could take both runs.
+    both_started = multiprocessing.get_context('fork').Barrier(2)
+
+    def run_queued(queued):
+        both_started.wait(timeout=10)
+        return FinishedRun(os.getpid())
+    assistant._run_queued = run_queued
+    pids = assistant.serve(max_runs=2, concurrency=2, idle_timeout=0.1,
+                           sleep_time=0.01)
+    assert len(pids) == 2
+    assert len(set(pids)) == 2
+    assert os.getpid() not in pids
+    # nothing was claimed in this process
+    assert assistant.runs.count_documents({'status': 'QUEUED'}) == 3
+
+
+class ObserverExperiment(object):
+    """Stands in for an experiment, a run reports the observers' client."""
+
+    def __init__(self, observers):
+        self.observers = observers
+
+    def run(self, command, config_updates, meta_info):
+        class Run(object):
+            _id = os.getpid()
+            result = self.observers[0].runs.database.client
+        return Run()
+
+
+def test_forked_runs_use_their_own_client(monkeypatch):
+    pymongo = pytest.importorskip('pymongo')
+    client = pymongo.MongoClient('localhost', connect=False)
+    observer = MongoObserver(client.labwatch.runs, None)
+    ex = ObserverExperiment([observer])
+    monkeypatch.setattr(labwatch.assistant, '_experiment', ex)
+    monkeypatch.setattr(labwatch.assistant, '_experiment_pid', os.getpid())
+    # the parent keeps its observer
+    assert labwatch.assistant._run_experiment(None, {}, {})[1] is client
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        _, used = labwatch.assistant._run_experiment(None, {}, {})
+        ok = (used is not client and
+              ex.observers[0].runs.full_name == 'labwatch.runs' and
+              labwatch.assistant._run_experiment(None, {}, {})[1] is used)
+        os.write(write, b'1' if ok else b'0')
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert os.read(read, 1) == b'1'
+    assert ex.observers == [observer]
+
+
+def fake_run_experiment(command, config, meta_info):
+    return os.getpid(), config['x']
+
+
+def test_optimize_feeds_results_to_optimizer(assistant, monkeypatch):
+    monkeypatch.setattr(labwatch.assistant, '_run_experiment',
+                        fake_run_experiment)
+    updates = []
+    assistant.current_search_space_name = 'float_space'
+    assistant.current_search_space = assistant._verify_and_init_search_space(
+        build_search_space(float_space))
+    optimizer = assistant._init_optimizer()
+    optimizer.update = lambda configs, costs, runs: updates.append(costs[0])
+
+    results = assistant.optimize(6, n_workers=2)
+    assert len(results) == 6
+    assert sorted(updates) == sorted(config['x'] for config, _ in results)
+    assert sorted(updates) == sorted(result for _, result in results)
+    assert optimizer.pending == []
+
+
+def unstored_run_experiment(command, config, meta_info):
+    # runs that were not stored have no id
+    return None, config['x']
+
+
+def test_optimize_selects_space_and_injects_observer(assistant, monkeypatch):
+    monkeypatch.setattr(labwatch.assistant, '_run_experiment',
+                        unstored_run_experiment)
+    assistant.search_space(float_space)
+    # e.g. the observer of the -m option is not one of the experiment's
+    observer = MongoObserver(mongomock.MongoClient().db.runs, None)
+    assistant.mongo_observer = observer
+
+    results = assistant.optimize(3, search_space='float_space')
+    assert len(results) == 3
+    assert assistant.current_search_space_name == 'float_space'
+    assert observer in assistant.ex.observers
+    assert assistant.optimizer_state.known_jobs == set()
+    # runs without an id do not break later updates
+    assistant.update_optimizer()
+
+    with pytest.raises(KeyError):
+        assistant.optimize(1, search_space='no_space')
+
+
+def test_optimizer_modifications_are_written(assistant):
+    assistant.runs.insert_many([
+        {'_id': 1, 'info': {'a': 1, 'b': 2}},
+        {'_id': 2, 'info': {'a': 1}}])
+    assistant._write_info({1: {'b': 3, 'c': 4}, 2: {}})
+    assert assistant.runs.find_one({'_id': 1})['info'] == \
+        {'a': 1, 'b': 3, 'c': 4}
+    assert assistant.runs.find_one({'_id': 2})['info'] == {'a': 1}
+
+
+def test_top_k_by_objective(assistant):
+    assistant.current_search_space_name = 'float_space'
+    assistant.current_search_space = assistant._verify_and_init_search_space(
+        build_search_space(float_space))
+    space = {'meta': {'options': {'UPDATE': ['float_space']}}}
+    assistant.runs.insert_many([
+        dict(space, _id=1, status='COMPLETED', config={'x': 0.1},
+             result={'optimization_target': 3.}),
+        dict(space, _id=2, status='COMPLETED', config={'x': 0.2}, result=1.),
+        dict(space, _id=3, status='COMPLETED', config={'x': 0.3},
+             result=2., objective=2.),
+        dict(space, _id=4, status='RUNNING', config={'x': 0.4}, result=0.),
+        {'_id': 5, 'status': 'COMPLETED', 'config': {'y': 1}, 'result': 0.}])
+    assert assistant.get_top_k(2) == [({'x': 0.2}, 1.), ({'x': 0.3}, 2.)]
+    assert assistant.runs.find_one({'_id': 1})['objective'] == 3.
+    assert assistant.get_current_best() == ({'x': 0.2}, 1.)
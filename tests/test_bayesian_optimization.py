@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# coding=utf-8
+from __future__ import division, print_function, unicode_literals
+import numpy as np
+import pytest
+
+from labwatch.hyperparameters import *
+from labwatch.searchspace import build_search_space
+from labwatch.optimizers import bayesian_optimization
+from labwatch.optimizers.bayesian_optimization import BayesianOptimization
+
+
+def numerical_space():
+    x = UniformFloat(lower=0., upper=1.)
+    y = UniformFloat(lower=0., upper=1.)
+
+
+class StubModel(object):
+    """Records how it was trained and moves the walkers on every fit."""
+
+    def __init__(self, n_hypers):
+        self.n_hypers = n_hypers
+        self.p0 = None
+        self.burned = False
+        self.chain_length = None
+        self.fits = []
+
+    def train(self, X, y):
+        self.fits.append({'n': X.shape[0], 'burned': self.burned,
+                          'chain_length': self.chain_length,
+                          'p0': None if self.p0 is None else self.p0.copy()})
+        self.p0 = np.full([self.n_hypers, 3], float(X.shape[0]))
+
+
+@pytest.fixture
+def make_optimizer(monkeypatch):
+    # RoBO is not needed, the stub replaces the GP
+    monkeypatch.setattr(bayesian_optimization, '_import_robo', lambda: None)
+    monkeypatch.setattr(
+        BayesianOptimization, '_build_model',
+        lambda self: (StubModel(self.n_hypers), None, None))
+
+    def make(**kwargs):
+        return BayesianOptimization(build_search_space(numerical_space),
+                                    n_hypers=4, chain_length=200,
+                                    incremental_chain_length=50, rng=0,
+                                    **kwargs)
+    return make
+
+
+def train(optimizer, n):
+    rng = np.random.RandomState(n)
+    return optimizer._train(rng.rand(n, 2), rng.rand(n))
+
+
+def test_train_continues_the_chain(make_optimizer):
+    optimizer = make_optimizer()
+    model = train(optimizer, 3)
+    assert train(optimizer, 4) is model
+    first, second = model.fits
+    assert not first['burned'] and first['chain_length'] == 200
+    assert second['burned'] and second['chain_length'] == 50
+    # the second fit starts where the walkers of the first one stopped
+    assert np.all(second['p0'] == 3.)
+    assert np.all(optimizer.p0 == 4.)
+
+
+def test_train_refits_every_n_observations(make_optimizer):
+    optimizer = make_optimizer(refit_every=3)
+    for n in range(2, 8):
+        train(optimizer, n)
+    burned = [fit['burned'] for fit in optimizer.model.fits]
+    assert burned == [False, True, True, False, True, True]
+    assert optimizer.n_refit == 5
+
+
+def test_train_warm_starts_from_restored_state(make_optimizer):
+    optimizer = make_optimizer()
+    train(optimizer, 3)
+    restored = make_optimizer()
+    restored.set_state(optimizer.get_state())
+    model = train(restored, 4)
+    assert model.fits[0]['burned']
+    assert np.all(model.fits[0]['p0'] == 3.)
+
+    # walkers of a different number of hypers can not be continued
+    other = make_optimizer()
+    other.n_hypers = 8
+    other.set_state(optimizer.get_state())
+    assert not train(other, 4).fits[0]['burned']
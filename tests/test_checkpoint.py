@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# coding=utf-8
+from __future__ import division, print_function, unicode_literals
+
+import io
+import pickle
+
+import bson
+import numpy as np
+import pytest
+
+from labwatch.utils.checkpoint import dump_state, load_state
+
+
+def test_round_trip():
+    state = {'optimizer': {'X': np.random.rand(4, 2), 'y': np.arange(4.),
+                           'incumbent_value': np.float64(0.5),
+                           'p0': np.random.rand(20, 3), 'n_refit': 2},
+             'optimizer_class': 'BayesianOptimization',
+             'watermark': None,
+             'known_jobs': [5, 7]}
+    restored = load_state(dump_state(state))
+    assert np.all(restored['optimizer']['X'] == state['optimizer']['X'])
+    assert np.all(restored['optimizer']['p0'] == state['optimizer']['p0'])
+    assert restored['optimizer']['incumbent_value'] == 0.5
+    assert restored['optimizer']['n_refit'] == 2
+    assert restored['optimizer_class'] == 'BayesianOptimization'
+    assert restored['watermark'] is None
+    assert restored['known_jobs'] == [5, 7]
+
+
+class Payload(object):
+    executed = False
+
+    def __reduce__(self):
+        return setattr, (Payload, 'executed', True)
+
+
+def test_pickles_are_rejected():
+    with pytest.raises(ValueError):
+        load_state(pickle.dumps({'optimizer': Payload()}))
+    assert not Payload.executed
+
+    # neither are pickled arrays inside an archive
+    data = dump_state({'X': np.array([Payload()], dtype=object)})
+    with pytest.raises(ValueError):
+        load_state(data)
+    assert not Payload.executed
+
+
+def test_damaged_archives_are_rejected():
+    data = dump_state({'X': np.random.rand(20, 2), 'watermark': 3})
+    for n in [0, 10, len(data) // 2, len(data) - 1]:
+        with pytest.raises(ValueError):
+            load_state(data[:n])
+
+    # a broken structure or a missing array
+    with pytest.raises(ValueError):
+        load_state(_archive(__structure__=np.arange(10, dtype=np.uint8)))
+    structure = np.frombuffer(bson.BSON.encode({'X': {'__array__': 'a0'}}),
+                              dtype=np.uint8)
+    with pytest.raises(ValueError):
+        load_state(_archive(__structure__=structure))
+    with pytest.raises(ValueError):
+        load_state(_archive(a0=np.arange(3)))
+
+
+def _archive(**arrays):
+    f = io.BytesIO()
+    np.savez(f, **arrays)
+    return f.getvalue()
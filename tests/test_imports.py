@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# coding=utf-8
+from __future__ import division, print_function, unicode_literals
+import subprocess
+import sys
+
+import pytest
+
+from labwatch.hyperparameters import UniformFloat
+
+
+def numerical_space():
+    x = UniformFloat(lower=0., upper=1.)
+
+
+def run_python(code):
+    return subprocess.run([sys.executable, "-c", code],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+
+
+@pytest.mark.parametrize("module", ["labwatch", "labwatch.optimizers",
+                                    "labwatch.hyperparameters"])
+def test_import_does_not_load_backends(module):
+    code = ("import sys, {}\n"
+            "heavy = ['labwatch.assistant', 'ConfigSpace', 'robo', 'george',"
+            " 'smac', 'pymongo', 'gridfs']\n"
+            "print(' '.join(m for m in heavy if m in sys.modules))"
+            ).format(module)
+    result = run_python(code)
+    assert result.stdout.strip() == ""
+    assert result.stderr == ""
+
+
+def test_optimizers_resolve_lazily():
+    import labwatch.optimizers
+    from labwatch.optimizers.random_search import RandomSearch
+    assert labwatch.optimizers.RandomSearch is RandomSearch
+    assert "BayesianOptimization" in dir(labwatch.optimizers)
+    with pytest.raises(AttributeError):
+        labwatch.optimizers.NoSuchOptimizer
+
+
+def test_smac_without_dependencies_raises_import_error():
+    pytest.importorskip("ConfigSpace")
+    try:
+        import smac
+        pytest.skip("SMAC is installed")
+    except ImportError:
+        pass
+    from labwatch.optimizers import SMAC
+    from labwatch.searchspace import build_search_space
+    with pytest.raises(ImportError):
+        SMAC(build_search_space(numerical_space))
+
+
+def test_lab_assistant_resolves_lazily():
+    import labwatch
+    from labwatch.assistant import LabAssistant
+    assert labwatch.LabAssistant is LabAssistant
+
+
+def test_get_optimizer_by_name(monkeypatch):
+    import labwatch.optimizers as optimizers
+    from labwatch.optimizers.random_search import RandomSearch
+    assert optimizers.get_optimizer("randomsearch") is RandomSearch
+    assert optimizers.get_optimizer(RandomSearch) is RandomSearch
+    assert optimizers.get_optimizer(
+        "labwatch.optimizers.random_search.RandomSearch") is RandomSearch
+
+    monkeypatch.setattr(optimizers, "_registry", {})
+    optimizers.register_optimizer(
+        "Random", "labwatch.optimizers.random_search:RandomSearch")
+    assert optimizers.get_optimizer("random") is RandomSearch
+    # names keep the case they were registered with
+    assert "Random" in optimizers.list_optimizers()
+    assert "random" not in optimizers.list_optimizers()
+    assert "RandomSearch" in optimizers.list_optimizers()
+
+    with pytest.raises(KeyError):
+        optimizers.get_optimizer("NoSuchOptimizer")
+
+
+def test_get_optimizer_rejects_other_classes(monkeypatch):
+    import labwatch.optimizers as optimizers
+    monkeypatch.setattr(optimizers, "_registry", {})
+    optimizers.register_optimizer("Dict", dict)
+    with pytest.raises(TypeError):
+        optimizers.get_optimizer("dict")
+    with pytest.raises(TypeError):
+        optimizers.get_optimizer(dict)
+    with pytest.raises(TypeError):
+        optimizers.get_optimizer("labwatch.optimizers.get_optimizer")
+
+
+def test_get_optimizer_from_entry_point(monkeypatch):
+    import labwatch.optimizers as optimizers
+
+    from labwatch.optimizers.random_search import RandomSearch
+
+    class EntryPoint(object):
+        name = "Custom"
+
+        def load(self):
+            return RandomSearch
+
+    monkeypatch.setattr(optimizers, "_entry_points", lambda: [EntryPoint()])
+    assert optimizers.get_optimizer("custom") is RandomSearch
+    assert "Custom" in optimizers.list_optimizers()
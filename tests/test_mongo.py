@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# coding=utf-8
+from __future__ import division, print_function, unicode_literals
+
+import os
+
+import pytest
+mongomock = pytest.importorskip('mongomock')
+import mongomock.gridfs
+
+from labwatch.utils import mongo
+
+
+def test_clients_are_shared_per_url_and_options():
+    # the client connects lazily
+    a = mongo.get_client('localhost', connect=False, maxPoolSize=5)
+    b = mongo.get_client('localhost', maxPoolSize=5, connect=False)
+    c = mongo.get_client('localhost', connect=False, maxPoolSize=10)
+    assert a is b
+    assert a is not c
+
+
+def test_clients_are_not_shared_with_forked_children():
+    client = mongo.get_client('localhost', connect=False)
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        same = mongo.get_client('localhost', connect=False) is client
+        os.write(write, b'1' if same else b'0')
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert os.read(read, 1) == b'0'
+
+
+def test_gridfs_is_shared():
+    mongomock.gridfs.enable_gridfs_integration()
+    db = mongomock.MongoClient().db
+    assert mongo.get_gridfs(db) is mongo.get_gridfs(db)
+    assert mongo.get_gridfs(db) is not mongo.get_gridfs(db, 'other')
+
+
+def test_reconnect_uses_client_of_this_process():
+    pymongo = pytest.importorskip('pymongo')
+    shared = mongo.get_client('localhost', connect=False, maxPoolSize=7)
+    # a client that was not created by get_client, e.g. by sacred
+    other = pymongo.MongoClient('localhost', connect=False, maxPoolSize=8)
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        ok = True
+        for runs in [shared.labwatch.runs, other.labwatch.runs]:
+            new = mongo.reconnect(runs)
+            ok &= new.database.client is not runs.database.client
+            ok &= new.full_name == runs.full_name
+            ok &= mongo.reconnect(new) is new
+        new = mongo.reconnect(shared.labwatch.runs).database.client
+        ok &= new is mongo.get_client('localhost', connect=False,
+                                      maxPoolSize=7)
+        os.write(write, b'1' if ok else b'0')
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert os.read(read, 1) == b'1'
+    # the parent keeps its clients
+    assert mongo.reconnect(shared.labwatch.runs).database.client is shared
+
+
+def test_reconnect_keeps_other_clients():
+    runs = mongomock.MongoClient().db.runs
+    assert mongo.reconnect(runs) is runs
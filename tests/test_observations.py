@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# coding=utf-8
+from __future__ import division, print_function, unicode_literals
+
+import numpy as np
+import pytest
+
+from labwatch.utils.observations import ObservationBuffer
+
+
+def test_empty_buffer():
+    buf = ObservationBuffer()
+    assert len(buf) == 0
+    assert buf.X is None
+    assert buf.y is None
+
+
+def test_add_grows_buffer():
+    buf = ObservationBuffer(capacity=2)
+    for i in range(10):
+        assert buf.add(np.array([i, 0.5]), float(i))
+    assert len(buf) == 10
+    assert buf.X.shape == (10, 2)
+    np.testing.assert_array_equal(buf.X[:, 0], np.arange(10))
+    np.testing.assert_array_equal(buf.y, np.arange(10))
+
+
+def test_duplicates_are_ignored():
+    buf = ObservationBuffer()
+    assert buf.add([0.1, 0.2], 1.0)
+    assert not buf.add([0.1, 0.2], 2.0)
+    # a shared element is not a duplicate
+    assert buf.add([0.2, 0.1], 3.0)
+    assert [0.1, 0.2] in buf
+    assert [0.1, 0.3] not in buf
+    np.testing.assert_array_equal(buf.y, [1.0, 3.0])
+
+
+def test_extend_filters_duplicates_within_batch():
+    buf = ObservationBuffer()
+    buf.add([np.nan, 1.0], 0.0)
+    X = np.array([[0.0, 1.0], [0.0, 1.0], [np.nan, 1.0], [1.0, 0.0]])
+    assert buf.extend(X, [1.0, 2.0, 3.0, 4.0]) == 2
+    assert len(buf) == 3
+    np.testing.assert_array_equal(buf.y, [0.0, 1.0, 4.0])
+
+
+def test_extend_rejects_wrong_shapes():
+    buf = ObservationBuffer()
+    buf.add([0.0, 1.0], 0.0)
+    with pytest.raises(ValueError):
+        buf.extend(np.zeros([2, 3]), [1.0, 2.0])
+    with pytest.raises(ValueError):
+        buf.extend(np.zeros([2, 2]), [1.0])
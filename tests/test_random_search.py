@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# coding=utf-8
+from __future__ import division, print_function, unicode_literals
+
+from labwatch.hyperparameters import Categorical
+from labwatch.searchspace import build_search_space
+from labwatch.optimizers.random_search import RandomSearch
+
+
+def two_choices():
+    x = Categorical([1, 2])
+
+
+def test_pending_configs_are_not_suggested():
+    opt = RandomSearch(build_search_space(two_choices), rng=0)
+    opt.set_pending([{'x': 1}])
+    assert all(opt.suggest_configuration() == {'x': 2} for _ in range(20))
+    assert opt.suggest_configurations(10) == [{'x': 2}] * 10
+    assert opt.pending == [{'x': 1}]
+
+
+def test_without_pending_configs_all_are_suggested():
+    opt = RandomSearch(build_search_space(two_choices), rng=0)
+    assert {opt.suggest_configuration()['x'] for _ in range(20)} == {1, 2}
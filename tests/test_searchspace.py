@@ -2,8 +2,12 @@
 # coding=utf-8
 from __future__ import division, print_function, unicode_literals
 
+import numpy as np
+
 from labwatch.hyperparameters import *
-from labwatch.searchspace import build_search_space
+from labwatch.searchspace import (SearchSpace, build_search_space,
+                                  fill_in_values)
+from labwatch.utils.rng import spawn_rngs
 
 import pprint
 
@@ -44,3 +48,91 @@ def test_config_space_with_condition():
     pp.pprint(space)
     pp.pprint(cfg)
     assert space.valid(cfg) == True
+
+
+def test_sample_batch():
+    def space_with_condition():
+        batch_size = UniformNumber(lower=32, upper=64, default=32, type=int)
+        n_layers = Categorical([1, 2])
+        two = Constant(2)
+        units_second = UniformNumber(lower=32,
+                                     upper=64, default=32,
+                                     type=int) | Condition(n_layers, [two])
+        dropout_second = UniformNumber(lower=0.2, upper=0.8,
+                                       default=0.5, type=float) | Condition(
+            n_layers, [2])
+
+    space = build_search_space(space_with_condition)
+    batch = space.sample_batch(200)
+    assert len(batch) == 200
+    assert batch['batch_size'].shape == (200,)
+    assert ((32 <= batch['batch_size']) & (batch['batch_size'] <= 64)).all()
+    is_two = batch['n_layers'] == 2
+    assert (batch.is_active('units_second') == is_two).all()
+    assert (batch.is_active('dropout_second') == is_two).all()
+
+    cfgs = batch.to_dicts()
+    assert len(cfgs) == 200
+    for cfg, two_layers in zip(cfgs, is_two):
+        assert space.valid(cfg) == True
+        assert ('units_second' in cfg) == two_layers
+        assert isinstance(cfg['batch_size'], int)
+
+
+def test_sampling_is_reproducible_with_seed():
+    def space_with_condition():
+        n_layers = Categorical([1, 2])
+        lr = UniformFloat(1e-4, 1e-1, log_scale=True)
+        noise = Gaussian(0, 1.0)
+        units_second = UniformInt(lower=32, upper=64) | Condition(n_layers,
+                                                                  [2])
+
+    space = build_search_space(space_with_condition)
+    for seed in [0, 1]:
+        assert space.sample(rng=seed) == space.sample(rng=seed)
+        assert (space.sample_batch(10, rng=np.random.default_rng(seed))
+                .to_dicts() ==
+                space.sample_batch(10, rng=np.random.default_rng(seed))
+                .to_dicts())
+    assert space.sample_batch(10, rng=0).to_dicts() != \
+        space.sample_batch(10, rng=1).to_dicts()
+
+
+def test_spawned_rngs_are_reproducible():
+    first = [rng.random() for rng in spawn_rngs(42, 3)]
+    second = [rng.random() for rng in spawn_rngs(42, 3)]
+    assert first == second
+    assert len(set(first)) == 3
+
+
+def test_fill_and_get_values():
+    def nested_space():
+        n_layers = Categorical([1, 2])
+        optimizer = {'lr': UniformFloat(1e-4, 1e-1, log_scale=True),
+                     'betas': (0.9, UniformFloat(0.9, 0.999))}
+        units = [UniformInt(16, 32),
+                 UniformInt(16, 32) | Condition(n_layers, [2])]
+
+    space = build_search_space(nested_space)
+    for cfg in space.sample_batch(20, rng=0).to_dicts():
+        values = {space.parameters[name]['uid']: value
+                  for name, value in cfg.items()}
+        config = space.fill(values)
+        if cfg['n_layers'] == 2:
+            assert config == fill_in_values(space.search_space, values)
+        else:
+            assert config['units'][1] is None
+        assert space.get_values(config) == cfg
+
+    configs = [space.fill({p['uid']: 2 for p in space.parameters.values()}),
+               space.fill({p['uid']: 1 for p in space.parameters.values()
+                           if p['name'] != 'units[1]'})]
+    batch = space.get_values_batch(configs)
+    assert len(batch) == 2
+    assert list(batch['n_layers']) == [2, 1]
+    assert list(batch.is_active('units[1]')) == [True, False]
+    assert batch.to_dicts() == [space.get_values(c) for c in configs]
+
+    beta = UniformFloat(0.9, 0.999)
+    space = SearchSpace({'betas': (0.9, beta)})
+    assert space.fill({beta['uid']: 0.95}) == {'betas': (0.9, 0.95)}
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# coding=utf-8
+from __future__ import division, print_function, unicode_literals
+import numpy as np
+
+from labwatch.hyperparameters import *
+from labwatch.searchspace import build_search_space
+from labwatch.optimizers import get_optimizer
+from labwatch.optimizers.tpe import TPE, ParzenEstimator
+
+
+def mixed_space():
+    x = UniformFloat(lower=0., upper=1.)
+    learning_rate = UniformFloat(lower=1e-4, upper=1e-1, log_scale=True)
+    n_units = UniformInt(lower=1, upper=10)
+    noise = Gaussian(mu=0., sigma=1.)
+    optimizer = Categorical(["sgd", "adam"])
+    momentum = UniformFloat(lower=0., upper=1.) | Condition(optimizer,
+                                                             ["sgd"])
+
+
+def cost(config):
+    return ((config["x"] - 0.2) ** 2 + abs(config["n_units"] - 3) +
+            (config["optimizer"] != "sgd") +
+            (config.get("momentum", 0.) - 0.9) ** 2)
+
+
+def test_tpe_by_name():
+    assert get_optimizer("tpe") is TPE
+
+
+def test_parzen_estimator_is_normalized():
+    rng = np.random.default_rng(0)
+    est = ParzenEstimator(rng.random(5) * 0.1, 0.5, 1., 1., low=0., high=1.)
+    # the mean density on a fine grid of [0, 1] approximates the integral
+    x = (np.arange(10000) + 0.5) / 10000
+    assert np.isclose(np.mean(np.exp(est.log_pdf(x))), 1., atol=1e-3)
+    samples = est.sample(1000, rng)
+    assert np.all((samples >= 0) & (samples <= 1))
+    assert np.mean(samples < 0.2) > 0.5
+
+
+def test_tpe_suggests_valid_configs():
+    space = build_search_space(mixed_space)
+    opt = TPE(space, n_startup=5, rng=0)
+    for i in range(20):
+        config = opt.suggest_configuration()
+        assert 0 <= config["x"] <= 1
+        assert 1e-4 <= config["learning_rate"] <= 1e-1
+        assert isinstance(config["n_units"], int)
+        assert ("momentum" in config) == (config["optimizer"] == "sgd")
+        opt.update([config], [cost(config)], None)
+    assert opt.X.shape == (20, 6)
+
+
+def test_tpe_improves_over_startup():
+    space = build_search_space(mixed_space)
+    opt = TPE(space, n_startup=10, rng=1)
+    costs = []
+    for i in range(60):
+        config = opt.suggest_configuration()
+        costs.append(cost(config))
+        opt.update([config], [costs[-1]], None)
+    assert np.median(costs[-20:]) < np.median(costs[:10])
+    assert min(costs) < 0.1
+
+
+def test_tpe_counts_pending_as_bad():
+    space = build_search_space(mixed_space)
+    opt = TPE(space, rng=0)
+    configs = [space.sample(rng=i) for i in range(20)]
+    opt.update(configs, [cost(c) for c in configs], None)
+    X_good, X_bad = opt._split()
+    assert len(X_good) + len(X_bad) == 20
+    opt.set_pending(configs[:3])
+    X_good_pending, X_bad_pending = opt._split()
+    assert len(X_good_pending) == len(X_good)
+    assert len(X_bad_pending) == len(X_bad) + 3
+
+    # the state can be restored into a new optimizer
+    restored = TPE(space, rng=0)
+    restored.set_state(opt.get_state())
+    assert np.array_equal(restored.X, opt.X, equal_nan=True)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# coding=utf-8
+from __future__ import division, print_function, unicode_literals
+import numpy as np
+
+from labwatch.hyperparameters import *
+from labwatch.searchspace import build_search_space
+from labwatch.converters.convert_to_vector import VectorEncoder
+from labwatch.optimizers.random_search import RandomSearch
+
+
+def mixed_space():
+    batch_size = UniformNumber(lower=32, upper=64, default=32, type=int)
+    learning_rate = UniformFloat(lower=1e-4, upper=1e-1, default=1e-2,
+                                 log_scale=True)
+    noise = Gaussian(mu=0., sigma=2.)
+    n_layers = Categorical([1, 2])
+    units_second = UniformNumber(lower=32, upper=64, default=32,
+                                 type=int) | Condition(n_layers, [2])
+
+
+def test_encode_decode_roundtrip():
+    space = build_search_space(mixed_space)
+    encoder = VectorEncoder(space)
+    assert encoder.n_dims == 5
+    configs = [space.sample(rng=i) for i in range(20)]
+    values = [space.get_values(c) for c in configs]
+    X = encoder.encode(values)
+    assert X.shape == (20, 5)
+    for config, x in zip(values, X):
+        for name, v in zip(encoder.names, x):
+            assert np.isnan(v) == (config.get(name) is None)
+
+    decoded = encoder.decode(X)
+    for config, dec in zip(values, decoded):
+        active = {k: v for k, v in config.items() if v is not None}
+        assert set(dec) == set(active)
+        for k, v in active.items():
+            assert np.isclose(dec[k], v)
+
+
+def test_encode_bounds():
+    space = build_search_space(mixed_space)
+    encoder = VectorEncoder(space)
+    X = encoder.encode([{"batch_size": 32, "learning_rate": 1e-4,
+                         "noise": 2., "n_layers": 2, "units_second": 64},
+                        {"batch_size": 64, "learning_rate": 1e-1,
+                         "noise": 0., "n_layers": 1}])
+    j = encoder.names.index
+    assert 0 < X[0, j("batch_size")] < X[1, j("batch_size")] < 1
+    assert np.isclose(X[0, j("learning_rate")], 0)
+    assert np.isclose(X[1, j("learning_rate")], 1)
+    assert np.isclose(X[0, j("noise")], 1)
+    assert X[1, j("n_layers")] == 0
+    assert np.isnan(X[1, j("units_second")])
+
+
+def test_decode_applies_conditions():
+    space = build_search_space(mixed_space)
+    encoder = VectorEncoder(space)
+    x = np.full(encoder.n_dims, 0.5)
+    x[encoder.names.index("n_layers")] = 0
+    config = encoder.decode(x)[0]
+    assert config["n_layers"] == 1
+    assert "units_second" not in config
+    assert isinstance(config["batch_size"], int)
+
+
+def test_optimizer_update_encodes_configs():
+    space = build_search_space(mixed_space)
+    opt = RandomSearch(space)
+    configs = [space.get_values(space.sample(rng=i)) for i in range(3)]
+    opt.pending = configs[:1]
+    super(RandomSearch, opt).update(configs, [1., 2., 3.], None)
+    assert opt.X.shape == (3, 5)
+    X, y = opt._fantasize_pending()
+    assert X.shape == (4, 5)
+    assert y[-1] == 1.
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# coding=utf-8
+from __future__ import division, print_function, unicode_literals
+
+import pytest
+
+from labwatch.utils.version_checks import parse_version, check_dependencies
+
+
+def test_parse_version_ordering():
+    ordered = ['0.9', '1.0.dev1', '1.0a1', '1.0b2', '1.0rc1', '1.0',
+               '1.0.post1', '1.1', '1.10', '2!0.1']
+    keys = [parse_version(v) for v in ordered]
+    assert keys == sorted(keys)
+    assert parse_version('1.0') == parse_version('1.0.0')
+    assert parse_version('1.0+local') == parse_version('1.0')
+    # versions not following PEP 440 come first
+    assert parse_version('weird') < parse_version('0.0.1')
+
+
+def test_check_dependencies():
+    ex = ['numpy==1.17.0', 'sacred==0.7.5']
+    check_dependencies(ex, ['numpy==1.16.2'], 'newer')
+    check_dependencies(ex, ['numpy==1.17'], 'equal')
+    check_dependencies(ex, ['sacred==0.1'], 'exists')
+    with pytest.raises(AssertionError):
+        check_dependencies(ex, ['numpy==1.18'], 'newer')
+    with pytest.raises(AssertionError):
+        check_dependencies(ex, ['scipy==1.0'], 'exists')